@@ -1,9 +1,9 @@
-import sys, os, re, shutil, subprocess, json, logging
+import sys, os, re, shutil, signal, subprocess, json, logging, hashlib, time, glob, argparse, cProfile, pstats
 from pathlib import Path
 from datetime import datetime
-from urllib.parse import unquote
-import tkinter as tk
-from tkinter import filedialog, messagebox
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+import threading
 
 try:
     import yaml
@@ -11,73 +11,546 @@ except ImportError:
     print("ERROR: La librería PyYAML es necesaria. Ejecuta: pip install PyYAML")
     sys.exit(1)
 
+import markdown_scanner
+from link_resolver import VaultIndex
+from conversion_cache import ConversionCache, hash_file, hash_directory, cache_limit
+import image_optimizer
+import pandoc_ast
+
 # --- CONFIGURACIÓN GENERAL Y LOGGING ---
 logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s', stream=sys.stdout)
 BASE_DIR = Path(__file__).resolve().parent
 CONFIG_FILE = BASE_DIR / "config.json"
 TEMPLATE_DIR = BASE_DIR / "templates"
+CACHE_DIR = BASE_DIR / "cache"
+INDEX_CACHE_VERSION = 1
 ATTACHMENT_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.svg', '.pdf'}
 YAML_PATTERN = re.compile(r'^---\s*\n(.*?)\n---\s*\n', re.DOTALL)
-LINK_PATTERN = re.compile(r'(!?)\[\[([^|#\]]+)(?:\|([^\]]+))?\]\]')
 LIST_LINE_PATTERN = re.compile(r"^(\s*)-\s*(.*?)\[\[([^|#\]]+)(?:\|([^\]]+))?\]\](.*)")
-TAG_PATTERN = re.compile(r'(?<!#)#[\w-]+')
+INCLUDE_PATTERN = re.compile(r'!include\["([^"]+)"\]')
 OUTPUT_SUBFOLDER_NAME = "_Converted"
+OPTIMIZED_ASSETS_FOLDER_NAME = "Assets_optimized"
+MANIFEST_FILE_NAME = ".one_manifest.json"
+MANIFEST_VERSION = 1
+PROFILE_REPORT_NAME = "_export_profile"
+DEFAULT_FLATTEN_WORKERS = min(8, (os.cpu_count() or 1) + 4)
+DEFAULT_SCAN_WORKERS = 8  # concurrent directory listings; raise it for high-latency (SMB/NFS) vaults
+RACY_MTIME_WINDOW_NS = 2_000_000_000  # FAT/exFAT directory mtimes tick every 2 s, and some SMB servers are as coarse
+DEFAULT_CONVERSION_WORKERS = 3
+DEFAULT_CONVERSION_TIMEOUT = 600  # seconds per format
+ASSET_HASH_CACHE_FILE = CACHE_DIR / "asset_hashes.json"
+FICLONE = 0x40049409  # Linux ioctl for copy-on-write clones (btrfs, xfs)
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+def _scan_dir(vault_path: Path, rel_dir: str, exclude_folders: set, cached_entry):
+    # Returns (entry, changed). A directory's mtime only changes when entries are added, removed or renamed,
+    # so an unchanged directory reuses its cached listing and costs a single stat. Like git's racy index entries,
+    # a listing taken within RACY_MTIME_WINDOW_NS of the mtime is not trusted: a file created in the same
+    # timestamp tick would not have changed the mtime, so such directories are listed again.
+    abs_dir = os.path.join(vault_path, rel_dir)
+    scanned = time.time_ns()
+    try:
+        mtime = os.stat(abs_dir).st_mtime_ns
+    except OSError:
+        return None, False
+    if cached_entry and cached_entry.get('mtime') == mtime and mtime < cached_entry.get('scanned', 0) - RACY_MTIME_WINDOW_NS:
+        return cached_entry, False
+    files, subdirs = [], []
+    try:
+        with os.scandir(abs_dir) as it:
+            for dir_entry in it:
+                if dir_entry.is_dir():
+                    if not dir_entry.is_symlink() and dir_entry.name not in exclude_folders:
+                        subdirs.append(dir_entry.name)
+                else:
+                    files.append(dir_entry.name)
+    except OSError as e:
+        logging.warning(f"Could not list directory {abs_dir}: {e}")
+        return None, False
+    changed = not cached_entry or set(cached_entry['files']) != set(files) or set(cached_entry['dirs']) != set(subdirs)
+    return {'mtime': mtime, 'scanned': scanned, 'files': files, 'dirs': subdirs}, changed
+
+def scan_vault_dirs(vault_path: Path, exclude_folders: list, cached_dirs: dict, workers: int = DEFAULT_SCAN_WORKERS, on_dir=None, stats: dict = None):
+    # Every directory is still stat'ed, because a change deep in a subtree does not touch its parents' mtimes.
+    # With several workers, sibling subtrees are listed concurrently: on network mounts each listing is mostly
+    # waiting on a round trip. on_dir(rel_dir, files) is called as each directory completes.
+    start = time.perf_counter()
+    exclude_folders = set(exclude_folders)
+    dirs_table, rescanned, file_count = {}, 0, 0
+
+    def record(rel_dir, entry, changed):
+        nonlocal rescanned, file_count
+        dirs_table[rel_dir] = entry
+        rescanned += changed
+        file_count += len(entry['files'])
+        if on_dir: on_dir(rel_dir, entry['files'])
+        return [f"{rel_dir}/{d}" if rel_dir else d for d in entry['dirs']]
+
+    if workers <= 1:
+        stack = ['']
+        while stack:
+            rel_dir = stack.pop()
+            entry, changed = _scan_dir(vault_path, rel_dir, exclude_folders, cached_dirs.get(rel_dir))
+            if entry is not None: stack.extend(reversed(record(rel_dir, entry, changed)))
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = {pool.submit(_scan_dir, vault_path, '', exclude_folders, cached_dirs.get('')): ''}
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    rel_dir = pending.pop(future)
+                    entry, changed = future.result()
+                    if entry is None: continue
+                    for child in record(rel_dir, entry, changed):
+                        pending[pool.submit(_scan_dir, vault_path, child, exclude_folders, cached_dirs.get(child))] = child
+    if stats is not None:
+        seconds = time.perf_counter() - start
+        stats.update(directories=len(dirs_table), listed=rescanned, files=file_count, workers=max(1, workers), seconds=round(seconds, 4),
+                     directories_per_second=round(len(dirs_table) / seconds, 1) if seconds else None,
+                     files_per_second=round(file_count / seconds, 1) if seconds else None)
+    return dirs_table, rescanned
+
+def build_index_from_dirs(vault_path: Path, dirs_table: dict) -> VaultIndex:
+    return _report_ambiguous_names(VaultIndex.from_dirs(vault_path, dirs_table))
+
+def _report_ambiguous_names(index: VaultIndex) -> VaultIndex:
+    ambiguous = index.ambiguous_keys()
+    if ambiguous:
+        logging.info(f"{len(ambiguous)} note/attachment names are shared by several files; "
+                     f"links to them resolve to the copy closest to the vault root (use [[folder/name]] to pick another).")
+    return index
+
+
+class ExportMetrics:
+    """Wall time and file I/O per export stage, plus link-resolution counters."""
+    STAGE_FIELDS = ('seconds', 'files_read', 'bytes_read', 'files_written', 'bytes_written')
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self.current_stage = 'other'
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        # Top-level stages run one after another, so the current stage is shared by the worker threads they start.
+        previous, self.current_stage = self.current_stage, name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, seconds=time.perf_counter() - start)
+            self.current_stage = previous
+
+    def add(self, stage=None, **amounts):
+        with self._lock:
+            entry = self.stages.setdefault(stage or self.current_stage, dict.fromkeys(self.STAGE_FIELDS, 0))
+            for key, amount in amounts.items(): entry[key] += amount
+
+    def read(self, nbytes, stage=None):
+        self.add(stage, files_read=1, bytes_read=nbytes)
+
+    def wrote(self, nbytes, stage=None):
+        self.add(stage, files_written=1, bytes_written=nbytes)
+
+    def count(self, counter, amount=1):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def as_dict(self):
+        with self._lock:
+            stages = {name: dict(entry, seconds=round(entry['seconds'], 4)) for name, entry in self.stages.items()}
+            return {'stages': stages, 'counters': dict(self.counters)}
+
+
+class AssetStore:
+    """Copies each unique asset (by content hash) into Assets/ once, linking instead of copying when possible."""
+    def __init__(self, assets_dir: Path, link_mode: str = 'auto', metrics: ExportMetrics = None):
+        self.assets_dir = assets_dir
+        self.link_mode = link_mode
+        self.metrics = metrics or ExportMetrics()
+        self.name_by_hash = {}
+        self.hash_by_name = {}
+        self._reserved = {}  # digest -> name assigned by reserve() but not materialized yet
+        self.stats = {'unique': 0, 'deduplicated': 0, 'skipped': 0, 'reflinked': 0, 'hardlinked': 0, 'copied': 0}
+        self._lock = threading.Lock()
+        self._hash_cache = self._load_hash_cache()
+
+    def _load_hash_cache(self):
+        try:
+            return json.loads(ASSET_HASH_CACHE_FILE.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        try:
+            ASSET_HASH_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = ASSET_HASH_CACHE_FILE.with_suffix('.tmp')
+            with self._lock:
+                tmp_path.write_text(json.dumps(self._hash_cache), encoding='utf-8')
+            os.replace(tmp_path, ASSET_HASH_CACHE_FILE)
+        except OSError as e:
+            logging.warning(f"Could not save asset hash cache: {e}")
+
+    def file_hash(self, path: Path) -> str:
+        stat = path.stat()
+        key = str(path)
+        with self._lock:
+            cached = self._hash_cache.get(key)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        self.metrics.read(stat.st_size, 'asset_copy')
+        with self._lock:
+            self._hash_cache[key] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def reserve(self, sources: list, workers: int = 1):
+        # Names are fixed up front in the order the serial path would embed them (sorted notes, then embed
+        # order), so which of two same-named files gets the plain name does not depend on worker timing.
+        sources = list(dict.fromkeys(sources))
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            digests = list(pool.map(self.file_hash, sources))
+        with self._lock:
+            for source, digest in zip(sources, digests):
+                if digest not in self.name_by_hash and digest not in self._reserved:
+                    self._reserved[digest] = self._unique_name(source, digest)
+
+    def _unique_name(self, source: Path, digest: str) -> str:
+        name = source.name
+        if name.lower() in self.hash_by_name:
+            # A different file with the same basename already lives in Assets/.
+            name = f"{source.stem}-{digest[:8]}{source.suffix}"
+        self.hash_by_name[name.lower()] = digest
+        return name
+
+    def add(self, source: Path) -> str:
+        digest = self.file_hash(source)
+        with self._lock:
+            if digest in self.name_by_hash:
+                self.stats['deduplicated'] += 1
+                return self.name_by_hash[digest]
+            name = self._reserved.pop(digest, None) or self._unique_name(source, digest)
+            self.name_by_hash[digest] = name
+            self.stats['unique'] += 1
+        start = time.perf_counter()
+        self._materialize(source, self.assets_dir / name, digest)
+        self.metrics.add('asset_copy', seconds=time.perf_counter() - start)
+        return name
+
+    def _materialize(self, source: Path, destination: Path, digest: str):
+        if destination.exists():
+            if destination.stat().st_size == source.stat().st_size and self.file_hash(destination) == digest:
+                self._count('skipped')
+                return
+            destination.unlink()
+        if self.link_mode == 'auto':
+            if self._reflink(source, destination):
+                self._count('reflinked')
+                return
+            try:
+                os.link(source, destination)
+                self._count('hardlinked')
+                return
+            except OSError:
+                pass
+        shutil.copy2(source, destination)
+        self.metrics.wrote(destination.stat().st_size, 'asset_copy')
+        self._count('copied')
+
+    def _reflink(self, source: Path, destination: Path) -> bool:
+        if fcntl is None: return False
+        try:
+            with open(source, 'rb') as src, open(destination, 'wb') as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            shutil.copystat(source, destination)
+            return True
+        except OSError:
+            if destination.exists(): destination.unlink()
+            return False
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
 
 
 class ONEExporter:
-    def __init__(self, vault_path: Path, export_base_dir: Path, exclude_folders: list):
+    def __init__(self, vault_path: Path, export_base_dir: Path, exclude_folders: list, rebuild_index: bool = False, flatten_workers: int = DEFAULT_FLATTEN_WORKERS, asset_link_mode: str = 'auto',
+                 incremental: bool = False, export_name: str = None, vault_index: VaultIndex = None,
+                 note_cache: dict = None, metrics: ExportMetrics = None, scan_workers: int = DEFAULT_SCAN_WORKERS):
         self.vault_path = vault_path
         self.export_base_dir = export_base_dir
         self.exclude_folders = exclude_folders
+        self.rebuild_index = rebuild_index
+        self.flatten_workers = max(1, int(flatten_workers))
+        self.scan_workers = max(1, int(scan_workers))
+        self.scan_stats = {}
+        self.incremental = incremental
+        self.export_name = export_name
+        self.metrics = metrics or ExportMetrics()
         self.export_root = self._create_export_structure()
         self.notes_dir = self.export_root / "Notes"
         self.assets_dir = self.export_root / "Assets"
-        self.vault_index = self._build_vault_index()
+        if vault_index is None:
+            with self.metrics.stage('index'):
+                vault_index = self._build_vault_index()
+        self.vault_index = vault_index
+        self._resolution_baseline = self._resolution_counts()
         self.processed_notes = set()
-        self.copied_assets = set()
+        self.asset_store = AssetStore(self.assets_dir, asset_link_mode, self.metrics)
         self.notes_in_scope = set()
         self.structure_map = {}
+        self.flatten_errors = []
+        self._state_lock = threading.Lock()
+        self.previous_manifest = self._load_manifest() if self.incremental else {}
+        self.moc_path = None
+        self.note_records = {}
+        self.reused_notes = 0
+        # A note_cache passed in may outlive this export (server mode), so its entries are re-validated
+        # against the file's size and mtime once per export before being trusted.
+        self.note_cache = note_cache if note_cache is not None else {}
+        self.fresh_notes = set()
+        self.optimized_assets = {}  # format -> ({asset name: cached variant}, folder pandoc reads them from)
 
     def _create_export_structure(self):
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        dest_dir = self.export_base_dir / f"Export_{self.vault_path.name}_{timestamp}"
+        if self.incremental:
+            dest_dir = self.export_base_dir / (self.export_name or f"Export_{self.vault_path.name}")
+        else:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            dest_dir = self.export_base_dir / f"Export_{self.vault_path.name}_{timestamp}"
+            suffix = 2
+            while dest_dir.exists():  # several exports of the same vault within one second (batch mode)
+                dest_dir = self.export_base_dir / f"Export_{self.vault_path.name}_{timestamp}_{suffix}"
+                suffix += 1
         (dest_dir / "Notes").mkdir(parents=True, exist_ok=True)
         (dest_dir / "Assets").mkdir(exist_ok=True)
-        logging.info(f"Export folder created at: {dest_dir}")
+        logging.info(f"Export folder {'reused' if self.incremental else 'created'} at: {dest_dir}")
         return dest_dir
 
+    def _load_manifest(self):
+        manifest_path = self.export_root / MANIFEST_FILE_NAME
+        try:
+            data = json.loads(manifest_path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return {}
+        if data.get('version') != MANIFEST_VERSION or data.get('vault') != str(self.vault_path):
+            logging.info("Export manifest is stale; re-exporting everything.")
+            return {}
+        return data
+
+    def _save_manifest(self):
+        data = {'version': MANIFEST_VERSION, 'vault': str(self.vault_path), 'moc': str(self.moc_path), 'notes': self.note_records,
+                'assets': sorted(self.asset_store.name_by_hash.values())}
+        tmp_path = self.export_root / (MANIFEST_FILE_NAME + '.tmp')
+        tmp_path.write_text(json.dumps(data, indent=1), encoding='utf-8')
+        os.replace(tmp_path, self.export_root / MANIFEST_FILE_NAME)
+
+    def _prune_stale_outputs(self):
+        for output_name in set(self.previous_manifest.get('notes', {})) - set(self.note_records):
+            (self.notes_dir / output_name).unlink(missing_ok=True)
+            logging.info(f"Removed note no longer in scope: {output_name}")
+        for asset_name in set(self.previous_manifest.get('assets', [])) - set(self.asset_store.name_by_hash.values()):
+            (self.assets_dir / asset_name).unlink(missing_ok=True)
+            logging.info(f"Removed unused asset: {asset_name}")
+
+    def _write_if_changed(self, path: Path, text: str):
+        if self.incremental and path.exists() and path.read_text(encoding='utf-8') == text: return False
+        path.write_text(text, encoding='utf-8')
+        self.metrics.wrote(len(text.encode('utf-8')))
+        return True
+
     def _build_vault_index(self):
         logging.info(f"Building index for vault: {self.vault_path}...")
-        index = {}
-        for root, dirs, files in os.walk(self.vault_path):
-            dirs[:] = [d for d in dirs if d not in self.exclude_folders]
-            for file in files:
-                full_path = Path(root) / file
-                if not any(excluded in full_path.parts for excluded in self.exclude_folders):
-                    index[full_path.stem.lower()] = full_path
-                    index[full_path.name.lower()] = full_path
-        logging.info(f"Index built with {len(index)} entries.")
+        cached_dirs = self._load_index_cache()
+        index = VaultIndex(self.vault_path)
+        dirs_table, rescanned = scan_vault_dirs(self.vault_path, self.exclude_folders, cached_dirs, self.scan_workers, index.add_files, self.scan_stats)
+        _report_ambiguous_names(index.freeze())
+        self._save_index_cache(dirs_table)
+        stats = self.scan_stats
+        logging.info(f"Index built with {len(index)} entries for {index.file_count()} files ({rescanned}/{len(dirs_table)} directories changed).")
+        logging.info(f"Vault scan: {stats['seconds']:.2f}s with {stats['workers']} threads, "
+                     f"{stats['directories_per_second'] or 0:.0f} directories/s, {stats['files_per_second'] or 0:.0f} files/s.")
         return index
 
-    def _clean_yaml(self, content: str) -> str:
-        return YAML_PATTERN.sub('', content, count=1)
+    def _index_cache_path(self):
+        vault_key = hashlib.sha1(str(self.vault_path.resolve()).encode('utf-8')).hexdigest()[:12]
+        return CACHE_DIR / f"index_{self.vault_path.name}_{vault_key}.json"
 
-    def _flatten_and_copy_note_content(self, note_path: Path):
-        if note_path in self.processed_notes: return
+    def _load_index_cache(self):
+        cache_path = self._index_cache_path()
+        if self.rebuild_index or not cache_path.exists(): return {}
+        try:
+            raw = cache_path.read_text(encoding='utf-8')
+            data = json.loads(raw)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Index cache unreadable, rebuilding: {e}")
+            return {}
+        self.metrics.read(len(raw))
+        if data.get('version') != INDEX_CACHE_VERSION or data.get('exclude_folders') != sorted(self.exclude_folders):
+            logging.info("Index cache invalidated (version or excluded folders changed).")
+            return {}
+        return data.get('dirs', {})
+
+    def _save_index_cache(self, dirs_table):
+        cache_path = self._index_cache_path()
+        data = {'version': INDEX_CACHE_VERSION, 'vault': str(self.vault_path), 'exclude_folders': sorted(self.exclude_folders), 'dirs': dirs_table}
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = cache_path.with_suffix('.tmp')
+            serialized = json.dumps(data)
+            tmp_path.write_text(serialized, encoding='utf-8')
+            os.replace(tmp_path, cache_path)
+            self.metrics.wrote(len(serialized))
+        except OSError as e:
+            logging.warning(f"Could not save index cache: {e}")
+
+    def _flatten_notes(self, notes):
+        # Notes sharing a file name would overwrite each other in Notes/; resolve that up front
+        # (last in sorted order wins) so the serial and concurrent paths produce the same package.
+        by_output_name = {}
+        for note in sorted(notes):
+            if note.name in by_output_name:
+                logging.warning(f"'{by_output_name[note.name]}' and '{note}' share an output name; keeping the latter.")
+            by_output_name[note.name] = note
+        pending = list(by_output_name.values())
+        if self.incremental:
+            pending = [note for note in pending if not self._reuse_flattened_note(note)]
+            logging.info(f"Incremental export: {self.reused_notes} notes unchanged, {len(pending)} to flatten.")
+        self._reserve_asset_names(pending)
+        if self.flatten_workers == 1 or len(pending) < 2:
+            for note in pending:
+                try:
+                    self._flatten_and_copy_note_content(note)
+                except Exception as e:
+                    self._record_flatten_error(note, e)
+        else:
+            logging.info(f"Flattening {len(pending)} notes with {self.flatten_workers} workers...")
+            with ThreadPoolExecutor(max_workers=self.flatten_workers) as pool:
+                futures = {pool.submit(self._flatten_and_copy_note_content, note): note for note in pending}
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        self._record_flatten_error(futures[future], e)
+        if self.flatten_errors:
+            logging.error(f"{len(self.flatten_errors)} of {len(pending)} notes could not be flattened.")
+        self.asset_store.save()
+        stats = self.asset_store.stats
+        if stats['unique']:
+            logging.info(f"Assets: {stats['unique']} unique, {stats['deduplicated']} duplicate embeds, {stats['skipped']} unchanged, "
+                         f"{stats['reflinked']} reflinked, {stats['hardlinked']} hardlinked, {stats['copied']} copied.")
+
+    def _reserve_asset_names(self, notes):
+        def embedded_attachments(note):
+            try:
+                links = self._parse_note(note)['links']
+            except (OSError, UnicodeDecodeError):
+                return []  # reported when the note itself is flattened
+            attachments = []
+            for is_embed, target, _ in links:
+                if not is_embed: continue
+                linked_file = self._resolve_target(target)
+                if linked_file and linked_file.suffix.lower() in ATTACHMENT_EXTENSIONS: attachments.append(linked_file)
+            return attachments
+        with ThreadPoolExecutor(max_workers=self.flatten_workers) as pool:
+            sources = [source for attachments in pool.map(embedded_attachments, notes) for source in attachments]
+        if sources: self.asset_store.reserve(sources, self.flatten_workers)
+
+    def _reuse_flattened_note(self, note_path: Path) -> bool:
+        record = self.previous_manifest.get('notes', {}).get(note_path.name)
+        if not record or record['source'] != str(note_path) or not (self.notes_dir / note_path.name).exists(): return False
+        try:
+            stat = note_path.stat()
+            if (stat.st_size, stat.st_mtime_ns) != (record['size'], record['mtime_ns']):
+                if stat.st_size != record['size'] or self._parse_note(note_path)['hash'] != record['hash']: return False
+            for target, resolved in record['embeds']:
+                linked_file = self._resolve_target(target)
+                if (str(linked_file) if linked_file else None) != resolved: return False
+            for source, asset_name in record['assets']:
+                if self.asset_store.add(Path(source)) != asset_name: return False
+        except OSError:
+            return False
         self.processed_notes.add(note_path)
-        content = self._clean_yaml(note_path.read_text(encoding='utf-8'))
-        content = TAG_PATTERN.sub('', content)
-        def link_flattener(match):
-            is_embed, target, alias = match.groups()
-            clean_target_name = unquote(target).lower()
+        self.note_records[note_path.name] = dict(record, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+        self.reused_notes += 1
+        return True
+
+    def _text_hash(self, text: str) -> str:
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    @property
+    def resolver(self):
+        return self.vault_index.resolver()
+
+    def _resolve_target(self, target: str):
+        return self.resolver.resolve(target)
+
+    def _resolution_counts(self):
+        resolver = self.resolver
+        return {'index_hits': resolver.index_hits, 'index_misses': resolver.index_misses, 'resolution_memo_hits': resolver.memo_info().hits}
+
+    def _parse_note(self, note_path: Path):
+        # Each note is read and scanned once per export; traversal, flattening and MOC generation share the result.
+        parsed = self.note_cache.get(note_path)
+        if parsed is not None:
+            if note_path in self.fresh_notes: return parsed
+            stat = note_path.stat()
+            if (stat.st_size, stat.st_mtime_ns) == (parsed['size'], parsed['mtime_ns']):
+                self.fresh_notes.add(note_path)
+                return parsed
+        stat = note_path.stat()
+        raw_content = note_path.read_text(encoding='utf-8')
+        self.metrics.read(stat.st_size)
+        body_start = markdown_scanner.body_start(raw_content)
+        parsed = {'hash': self._text_hash(raw_content), 'text': raw_content, 'body_start': body_start,
+                  'links': markdown_scanner.scan_links(raw_content, body_start), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        with self._state_lock:
+            self.note_cache[note_path] = parsed
+            self.fresh_notes.add(note_path)
+        return parsed
+
+    def _linked_notes(self, note_path: Path):
+        linked = []
+        for is_embed, target, _ in self._parse_note(note_path)['links']:
+            if is_embed: continue
+            resolved = self._resolve_target(target)
+            if resolved and resolved.suffix.lower() == '.md': linked.append(resolved)
+        return linked
+
+    def _record_flatten_error(self, note_path, error):
+        logging.error(f"Could not flatten '{note_path}': {error}")
+        self.flatten_errors.append((note_path, error))
+
+    def _flatten_and_copy_note_content(self, note_path: Path):
+        with self._state_lock:
+            if note_path in self.processed_notes: return
+            self.processed_notes.add(note_path)
+        stat = note_path.stat()
+        parsed = self._parse_note(note_path)
+        embeds, assets = [], []
+        def link_flattener(is_embed, target, alias):
             if is_embed:
-                linked_file = self.vault_index.get(clean_target_name) or self.vault_index.get(Path(clean_target_name).stem)
+                linked_file = self._resolve_target(target)
+                embeds.append([target, str(linked_file) if linked_file else None])
                 if linked_file and linked_file.suffix.lower() in ATTACHMENT_EXTENSIONS:
-                    shutil.copy(linked_file, self.assets_dir / linked_file.name)
-                    return f"![{alias or target}]({linked_file.name})"
+                    asset_name = self.asset_store.add(linked_file)
+                    assets.append([str(linked_file), asset_name])
+                    return f"![{alias or target}]({asset_name})"
                 return f"(Contenido embebido de: {target})"
             return alias or target
-        (self.notes_dir / note_path.name).write_text(LINK_PATTERN.sub(link_flattener, content), encoding='utf-8')
+        flattened = markdown_scanner.render(parsed['text'], link_flattener, parsed['body_start'])
+        self._write_if_changed(self.notes_dir / note_path.name, flattened)
+        with self._state_lock:
+            self.note_records[note_path.name] = {'source': str(note_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                                                 'hash': parsed['hash'], 'embeds': embeds, 'assets': assets}
 
     def _create_yaml_header(self, metadata, export_config):
         title = metadata.get('title', 'Untitled')
@@ -86,33 +559,41 @@ class ONEExporter:
         return f"---\ntitle: '{title}'\nauthor: '{author}'\ndate: {date_val}\nexport_style: {export_config.get('style', 'classic')}\ncover-image: '{export_config.get('cover-image', '')}'\n---\n\n"
 
     def build_package(self, start_note_path: Path, export_config: dict):
+        # Index paths are absolute, so the walk starts from the resolved MOC path; otherwise a relative
+        # MOC path and the index's copy of it would be two different notes.
+        self.moc_path = start_note_path.resolve()
+        if self.previous_manifest and self.previous_manifest.get('moc') != str(self.moc_path):
+            logging.info("Export manifest belongs to another MOC; re-exporting everything.")
+            self.previous_manifest = {}
         mode = export_config.get('mode', 'manual')
         if mode == 'manual':
             logging.info("Starting build in Manual Mode...")
-            moc_content = start_note_path.read_text(encoding='utf-8')
-            moc_body = self._clean_yaml(moc_content)
-            for match in LINK_PATTERN.finditer(moc_body):
-                if not match.group(1):
-                    clean_target_name = unquote(match.group(2)).lower()
-                    note = self.vault_index.get(clean_target_name) or self.vault_index.get(Path(clean_target_name).stem)
-                    if note and note.suffix.lower() == '.md':
-                        self.notes_in_scope.add(note)
-            for note in self.notes_in_scope:
-                self._flatten_and_copy_note_content(note)
-            self._generate_moc_from_blueprint(moc_body, export_config)
+            with self.metrics.stage('traverse'):
+                self.notes_in_scope.update(self._linked_notes(self.moc_path))
+            with self.metrics.stage('flatten'):
+                self._flatten_notes(self.notes_in_scope)
+            with self.metrics.stage('moc'):
+                moc = self._parse_note(self.moc_path)
+                self._generate_moc_from_blueprint(moc['text'][moc['body_start']:], export_config)
         else: # Automatic mode
             logging.info("Starting build in Automatic Mode...")
             depth = export_config.get('depth', 1)
             max_depth = -1 if str(depth).lower() == 'infinite' else int(depth)
-            self._traverse_and_collect(start_note_path, 0, max_depth)
-            for note in self.notes_in_scope:
-                self._flatten_and_copy_note_content(note)
-            self._generate_moc_from_structure(start_note_path, export_config)
+            with self.metrics.stage('traverse'):
+                self._traverse_and_collect(self.moc_path, 0, max_depth)
+            with self.metrics.stage('flatten'):
+                self._flatten_notes(self.notes_in_scope)
+            with self.metrics.stage('moc'):
+                self._generate_moc_from_structure(self.moc_path, export_config)
+        if self.incremental:
+            with self.metrics.stage('manifest'):
+                self._prune_stale_outputs()
+                self._save_manifest()
         logging.info("--- ✅ Export package build process completed! ---")
 
     def _generate_moc_from_blueprint(self, moc_blueprint, export_config):
         final_moc_lines, pending_heading = [], None
-        for line in moc_blueprint.splitlines():
+        for line in markdown_scanner.lines_outside_code(moc_blueprint):
             stripped_line = line.strip()
             if not stripped_line: continue
             if stripped_line.startswith('#'):
@@ -123,76 +604,261 @@ class ONEExporter:
                 indent_str, _, target, alias, _ = match.groups()
                 title = pending_heading or alias or target
                 pending_heading = None
-                clean_target_name = unquote(target).lower()
-                note = self.vault_index.get(clean_target_name) or self.vault_index.get(Path(clean_target_name).stem)
+                note = self._resolve_target(target)
                 if note:
                     level = len(indent_str) // 4
                     if level == 0 and final_moc_lines: final_moc_lines.append('\n\\newpage\n')
                     final_moc_lines.append(f"{'#' * (level + 1)} {title}\n!include[\"{note.name}\"]")
         yaml_header = self._create_yaml_header(export_config.get('metadata', {}), export_config)
-        (self.notes_dir / "_MOC_Guide.md").write_text(yaml_header + "\n".join(final_moc_lines), encoding='utf-8')
+        self._write_if_changed(self.notes_dir / "_MOC_Guide.md", yaml_header + "\n".join(final_moc_lines))
 
     def _traverse_and_collect(self, note_path, depth, max_depth):
-        if (max_depth != -1 and depth > max_depth) or note_path in self.notes_in_scope: return
-        self.notes_in_scope.add(note_path)
-        children = []
-        content = self._clean_yaml(note_path.read_text(encoding='utf-8'))
-        for match in LINK_PATTERN.finditer(content):
-            if not match.group(1):
-                clean_target_name = unquote(match.group(2)).lower()
-                child_path = self.vault_index.get(clean_target_name) or self.vault_index.get(Path(clean_target_name).stem)
-                if child_path and child_path.suffix.lower() == '.md':
-                    children.append(child_path)
-        self.structure_map[note_path] = {'depth': depth, 'children': children}
-        for child in children:
-            self._traverse_and_collect(child, depth + 1, max_depth)
+        # Iterative depth-first walk (same visiting order as a recursive one) so that
+        # long link chains with 'infinite' depth cannot hit the recursion limit.
+        stack = [(note_path, depth)]
+        while stack:
+            note_path, depth = stack.pop()
+            if (max_depth != -1 and depth > max_depth) or note_path in self.notes_in_scope: continue
+            self.notes_in_scope.add(note_path)
+            children = self._linked_notes(note_path)
+            self.structure_map[note_path] = {'depth': depth, 'children': children}
+            stack.extend((child, depth + 1) for child in reversed(children))
 
     def _generate_moc_from_structure(self, start_note, export_config):
-        final_moc_lines, processed = [], set()
-        def write_node(note):
-            if note in processed or note not in self.structure_map: return
+        final_moc_lines, processed, stack = [], set(), [start_note]
+        while stack:
+            note = stack.pop()
+            if note in processed or note not in self.structure_map: continue
             processed.add(note)
             data = self.structure_map[note]
             if data['depth'] == 0 and final_moc_lines: final_moc_lines.append('\n\\newpage\n')
             final_moc_lines.append(f"\n{'#' * (data['depth'] + 1)} {note.stem}\n!include[\"{note.name}\"]")
-            for child in data['children']: write_node(child)
-        write_node(start_note)
+            stack.extend(reversed(data['children']))
         yaml_header = self._create_yaml_header(export_config.get('metadata', {}), export_config)
-        (self.notes_dir / "_MOC_Guide.md").write_text(yaml_header + "\n".join(final_moc_lines), encoding='utf-8')
+        self._write_if_changed(self.notes_dir / "_MOC_Guide.md", yaml_header + "\n".join(final_moc_lines))
 
-    def convert_package(self, formats: list):
+    def convert_package(self, formats: list, workers: int = DEFAULT_CONVERSION_WORKERS, timeout=DEFAULT_CONVERSION_TIMEOUT, cache: ConversionCache = None,
+                        image_profiles: dict = None, image_workers: int = None, ast_cache: bool = False, cache_limits: dict = None):
+        # cache_limits: {'ast': bytes, 'images': bytes}, the LRU size limits of cache/ast and cache/images.
+        cache_limits = cache_limits or {}
         moc_path = self.notes_dir / "_MOC_Guide.md"
         if not moc_path.exists():
             logging.error("MOC Guide not found. Cannot run converter.")
-            return
-        final_markdown_content, metadata = self._assemble_full_markdown(moc_path)
+            return {}
+        output_dir = self.export_root / OUTPUT_SUBFOLDER_NAME
+        output_dir.mkdir(exist_ok=True)
+        # The assembled book is streamed note by note into one file that every pandoc job reads as its stdin,
+        # so it is never held in memory as a whole.
+        assembled_path = output_dir / f".{self.export_root.name}.assembled.md"
+        ast_path = output_dir / f".{self.export_root.name}.assembled.json"
+        try:
+            with self.metrics.stage('assemble'):
+                metadata = self._write_full_ast(moc_path, ast_path, cache_limits.get('ast')) if ast_cache else None
+                source, source_format = ast_path, 'json'
+                if metadata is None:
+                    metadata = self._write_full_markdown(moc_path, assembled_path)
+                    source, source_format = assembled_path, pandoc_ast.READER_FORMAT
+            if image_profiles:
+                with self.metrics.stage('images'):
+                    self._optimize_images(formats, image_profiles, image_workers, cache_limits.get('images'))
+            return self._convert_assembled_markdown(formats, source, source_format, metadata, output_dir, workers, timeout, cache)
+        finally:
+            assembled_path.unlink(missing_ok=True)
+            ast_path.unlink(missing_ok=True)
+
+    def _convert_assembled_markdown(self, formats, assembled_path, source_format, metadata, output_dir, workers, timeout, cache=None):
+        jobs, results, cache_keys, versions = {}, {}, {}, {}
+        cache_inputs = self._conversion_cache_inputs(assembled_path) if cache else None
         for fmt in formats:
             fmt = fmt.lower().strip()
-            if not fmt or fmt == 'md': continue
-            logging.info(f"--- Starting conversion to {fmt.upper()} ---")
-            output_dir = self.export_root / OUTPUT_SUBFOLDER_NAME
-            output_dir.mkdir(exist_ok=True)
+            if not fmt or fmt == 'md' or fmt in jobs: continue
             output_file = output_dir / f"{self.export_root.name}.{fmt}"
-            command = self._build_pandoc_command(fmt, output_file, metadata)
+            command = self._build_pandoc_command(fmt, output_file, metadata, source_format)
             if not command: continue
-            if self._run_pandoc_command(command, final_markdown_content):
-                logging.info(f"--- ✅ Conversion to {fmt.upper()} successful! ---")
-            else:
-                logging.error(f"--- ❌ Conversion to {fmt.upper()} failed. ---")
+            fmt_timeout = timeout.get(fmt, DEFAULT_CONVERSION_TIMEOUT) if isinstance(timeout, dict) else timeout
+            log_path = output_dir / f"{self.export_root.name}.{fmt}.log"
+            if cache:
+                cache_keys[fmt] = ConversionCache.make_key(fmt, *cache_inputs, self._normalized_command(command, output_file), self._tool_versions(command, versions))
+                if cache.fetch(cache_keys[fmt], output_file):
+                    log_path.write_text(f"$ {subprocess.list2cmdline(command)}\n\nReused cached output {cache_keys[fmt][:12]}.\n", encoding='utf-8')
+                    self.metrics.count('conversion_cache_hits')
+                    logging.info(f"--- ♻️ {fmt.upper()} unchanged since a previous export, reused from the conversion cache ---")
+                    results[fmt] = {'success': True, 'seconds': 0.0, 'log': str(log_path), 'cached': True}
+                    continue
+            jobs[fmt] = (command, fmt_timeout, log_path)
+        if jobs: self._run_conversion_jobs(jobs, assembled_path, workers, results, cache, cache_keys)
+        if not results: return {}
+        summary = ", ".join(f"{fmt.upper()} {'cached' if r['cached'] else 'ok' if r['success'] else 'FAILED'} in {r['seconds']:.1f}s" for fmt, r in results.items())
+        logging.info(f"Conversion summary: {summary}")
+        return results
+
+    def _run_conversion_jobs(self, jobs, assembled_path, workers, results, cache, cache_keys):
+        with ThreadPoolExecutor(max_workers=max(1, min(int(workers), len(jobs)))) as pool:
+            futures = {pool.submit(self._convert_format, fmt, command, assembled_path, fmt_timeout, log_path): fmt
+                       for fmt, (command, fmt_timeout, log_path) in jobs.items()}
+            for future in as_completed(futures):
+                fmt = futures[future]
+                success, elapsed = future.result()
+                results[fmt] = {'success': success, 'seconds': round(elapsed, 2), 'log': str(jobs[fmt][2]), 'cached': False}
+                output_file = Path(jobs[fmt][0][jobs[fmt][0].index('-o') + 1])
+                if success and cache and output_file.exists(): cache.store(cache_keys[fmt], output_file, output_file.name)
+
+    def _asset_hashes(self):
+        assets = {}
+        with os.scandir(self.assets_dir) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    assets[entry.name] = self.asset_store.hash_by_name.get(entry.name.lower()) or self.asset_store.file_hash(Path(entry.path))
+        return assets
+
+    def _optimize_images(self, formats, image_profiles, workers, max_bytes=None):
+        self.optimized_assets = {}
+        profiles = {fmt: image_profiles[fmt] for fmt in {f.lower().strip() for f in formats} if fmt in image_profiles}
+        if not profiles: return
+        if not image_optimizer.available():
+            logging.warning("Image optimization is enabled but Pillow is not installed (pip install Pillow); using the original images.")
+            return
+        optimizer = image_optimizer.ImageOptimizer(CACHE_DIR / "images", workers, max_bytes)
+        for fmt, variants in optimizer.optimize(self.assets_dir, self._asset_hashes(), profiles).items():
+            target_dir = self.export_root / OPTIMIZED_ASSETS_FOLDER_NAME / fmt
+            optimizer.materialize(variants, target_dir)
+            self.optimized_assets[fmt] = (variants, target_dir)
+        optimizer.prune()
+        stats = optimizer.stats
+        self.metrics.add('images', files_written=stats['optimized'], bytes_read=stats['bytes_before'], bytes_written=stats['bytes_after'])
+        logging.info(f"Images: {stats['optimized']} optimized ({stats['bytes_before'] / 1048576:.1f} MB -> {stats['bytes_after'] / 1048576:.1f} MB), "
+                     f"{stats['cached']} reused from cache, {stats['failed']} failed.")
+
+    def _conversion_cache_inputs(self, assembled_path):
+        # Everything pandoc reads besides the command: the document, the templates and the assets it embeds
+        # (optimized variants are named after their source hash and settings).
+        assets = self._asset_hashes()
+        for fmt, (variants, _) in self.optimized_assets.items():
+            assets.update({f"{fmt}/{name}": variant.name for name, variant in variants.items()})
+        return hash_file(assembled_path).hexdigest(), hash_directory(TEMPLATE_DIR), assets
+
+    @staticmethod
+    def _tool_versions(command, versions):
+        # Versions of pandoc and, for PDF, its --pdf-engine; 'versions' memoizes them across the formats of one export.
+        engines = [arg.split('=', 1)[1] for arg in command if arg.startswith('--pdf-engine=')]
+        if 'pandoc' not in versions: versions['pandoc'] = pandoc_ast.pandoc_version()
+        for engine in engines:
+            if engine not in versions: versions[engine] = pandoc_ast.program_version([engine])
+        return {name: versions[name] for name in ['pandoc', *engines]}
+
+    def _normalized_command(self, command, output_file):
+        # Export folders are timestamped, so their paths must not be part of the cache key.
+        return [arg.replace(str(output_file), '<output>').replace(str(self.export_root), '<export>') for arg in command]
+
+    def _convert_format(self, fmt, command, content, timeout, log_path):
+        logging.info(f"--- Starting conversion to {fmt.upper()} ---")
+        start = time.perf_counter()
+        success = self._run_pandoc_command(command, content, log_path, timeout)
+        elapsed = time.perf_counter() - start
+        output_file = Path(command[command.index('-o') + 1])
+        self.metrics.add(f'pandoc_{fmt}', seconds=elapsed, files_read=1, bytes_read=content.stat().st_size if isinstance(content, Path) else 0,
+                         files_written=int(output_file.exists()), bytes_written=output_file.stat().st_size if output_file.exists() else 0)
+        if success:
+            logging.info(f"--- ✅ Conversion to {fmt.upper()} successful! ({elapsed:.1f}s) ---")
+        else:
+            logging.error(f"--- ❌ Conversion to {fmt.upper()} failed. ({elapsed:.1f}s, see {log_path.name}) ---")
+        return success, elapsed
 
     def _assemble_full_markdown(self, moc_path):
         content = moc_path.read_text(encoding='utf-8')
-        def replacer(match):
+        return "".join(self._iter_full_markdown(content)), self._read_moc_metadata(content)
+
+    def _write_full_markdown(self, moc_path, destination: Path):
+        content = moc_path.read_text(encoding='utf-8')
+        with open(destination, 'w', encoding='utf-8', newline='') as f:
+            for chunk in self._iter_full_markdown(content):
+                f.write(chunk)
+        self.metrics.wrote(destination.stat().st_size)
+        return self._read_moc_metadata(content)
+
+    def _iter_full_markdown(self, moc_content):
+        position = 0
+        for match in INCLUDE_PATTERN.finditer(moc_content):
+            yield moc_content[position:match.start()]
             name = match.group(1)
             path = self.notes_dir / name
-            return path.read_text(encoding='utf-8') if path.exists() else f"<!-- INCLUDE FAILED: {name} -->"
-        full_content = re.sub(r'!include\["([^"]+)"\]', replacer, content)
-        yaml_data = yaml.safe_load(YAML_PATTERN.search(full_content).group(1)) or {}
-        return full_content, yaml_data
+            if path.exists():
+                note_content = path.read_text(encoding='utf-8')
+                self.metrics.read(len(note_content.encode('utf-8')))
+                yield note_content
+            else:
+                yield f"<!-- INCLUDE FAILED: {name} -->"
+            position = match.end()
+        yield moc_content[position:]
+
+    def _write_full_ast(self, moc_path, destination: Path, max_bytes: int = None):
+        # Returns None when pandoc is missing or cannot parse a note, so the caller falls back to Markdown.
+        version = pandoc_ast.pandoc_version()
+        if not version:
+            logging.warning("Pandoc not found; cannot build the document AST.")
+            return None
+        content = moc_path.read_text(encoding='utf-8')
+        skeleton, names, texts, position = [], [], {}, 0
+        for match in INCLUDE_PATTERN.finditer(content):
+            skeleton.append(content[position:match.start()])
+            skeleton.append(pandoc_ast.placeholder(len(names)))
+            path = self.notes_dir / match.group(1)
+            if path.exists():
+                texts[len(names)] = path.read_text(encoding='utf-8')
+                self.metrics.read(len(texts[len(names)].encode('utf-8')))
+            names.append(match.group(1))
+            position = match.end()
+        skeleton.append(content[position:])
+        cache = pandoc_ast.AstCache(CACHE_DIR / "ast", version, max_bytes=max_bytes)
+        try:
+            with ThreadPoolExecutor(max_workers=self.flatten_workers) as pool:
+                skeleton_future = pool.submit(cache.parse, "".join(skeleton))
+                futures = {part: pool.submit(cache.parse, text) for part, text in texts.items()}
+                skeleton_path = skeleton_future.result()
+                parts = {part: future.result() for part, future in futures.items()}
+        except pandoc_ast.AstError as e:
+            logging.warning(f"Pandoc could not parse a note to its AST, converting from Markdown instead: {e}")
+            cache.prune()
+            return None
+        pandoc_ast.write_document(destination, cache.load(skeleton_path), parts, dict(enumerate(names)))
+        self.metrics.wrote(destination.stat().st_size)
+        cache.prune()
+        self.metrics.count('ast_notes_parsed', cache.stats['parsed'])
+        self.metrics.count('ast_cache_hits', cache.stats['cached'])
+        logging.info(f"Document AST assembled: {cache.stats['parsed']} parts parsed, {cache.stats['cached']} reused from cache.")
+        return self._read_moc_metadata(content)
+
+    def _read_moc_metadata(self, moc_content):
+        # The document metadata is the MOC guide's own frontmatter, which always opens the assembled text.
+        frontmatter = markdown_scanner.frontmatter(moc_content)
+        return (yaml.safe_load(frontmatter) or {}) if frontmatter is not None else {}
 
-    def _build_pandoc_command(self, fmt, output_file, metadata):
+    def write_profile_report(self, total_seconds: float, profiler: cProfile.Profile = None):
+        report = self.metrics.as_dict()
+        current = self._resolution_counts()
+        report['counters'].update({key: current[key] - self._resolution_baseline[key] for key in current})
+        report.update(export_root=str(self.export_root), vault=str(self.vault_path), notes_in_scope=len(self.notes_in_scope),
+                      reused_notes=self.reused_notes, flatten_errors=len(self.flatten_errors), assets=self.asset_store.stats, scan=self.scan_stats)
+        # Wall time of the whole export; stages overlap (pandoc jobs run concurrently), so they do not add up to it.
+        report['total_seconds'] = round(total_seconds, 4)
+        if profiler:
+            profile_path = self.export_root / f"{PROFILE_REPORT_NAME}.prof"
+            profiler.dump_stats(profile_path)
+            with open(self.export_root / f"{PROFILE_REPORT_NAME}.txt", 'w', encoding='utf-8') as f:
+                pstats.Stats(str(profile_path), stream=f).sort_stats('cumulative').print_stats(40)
+            report['cprofile'] = str(profile_path)
+        report_path = self.export_root / f"{PROFILE_REPORT_NAME}.json"
+        report_path.write_text(json.dumps(report, indent=2), encoding='utf-8')
+        logging.info(f"Profiling report written to: {report_path}")
+        return report_path
+
+    def _build_pandoc_command(self, fmt, output_file, metadata, source_format=pandoc_ast.READER_FORMAT):
         resource_path = f"{self.notes_dir}{os.pathsep}{self.assets_dir}"
-        command = ["pandoc", "--from=markdown+raw_tex", "-o", str(output_file), "--resource-path", resource_path, "--standalone", "--toc", "--number-sections"]
+        if fmt in self.optimized_assets:
+            # Optimized variants shadow the originals; anything not optimized is still found in Assets/.
+            optimized_dir = self.optimized_assets[fmt][1]
+            resource_path = f"{self.notes_dir}{os.pathsep}{optimized_dir}{os.pathsep}{self.assets_dir}"
+        command = [*pandoc_ast.PANDOC_COMMAND, f"--from={source_format}", "-o", str(output_file), "--resource-path", resource_path, "--standalone", "--toc", "--number-sections"]
         if fmt == 'pdf':
             style_options = ['-V', 'documentclass=article']
             if metadata.get('export_style') == 'modern':
@@ -210,19 +876,63 @@ class ONEExporter:
             css_path = TEMPLATE_DIR / "stylesheet.css"
             if css_path.exists(): command.extend(["--css", str(css_path)])
             if metadata.get('cover-image'):
-                cover_path = self.assets_dir / Path(metadata['cover-image']).name
+                cover_name = Path(metadata['cover-image']).name
+                cover_path = self.assets_dir / cover_name
+                if cover_name in self.optimized_assets.get(fmt, ({},))[0]: cover_path = self.optimized_assets[fmt][1] / cover_name
                 if cover_path.exists(): command.extend(["--epub-cover-image", str(cover_path)])
         return command
 
-    def _run_pandoc_command(self, command, content):
+    def _run_pandoc_command(self, command, content, log_path=None, timeout=None):
+        stderr, success = b'', False
         try:
-            result = subprocess.run(command, input=content.encode('utf-8'), check=True, capture_output=True)
-            if result.stderr: logging.info(f"Pandoc Messages:\n{result.stderr.decode('utf-8')}")
-            return True
+            if isinstance(content, Path):
+                with open(content, 'rb') as source:
+                    stderr, success = _run_process_group(command, source, None, timeout), True
+            else:
+                stderr, success = _run_process_group(command, subprocess.PIPE, content.encode('utf-8'), timeout), True
+        except subprocess.TimeoutExpired as e:
+            logging.error(f"Pandoc timed out after {timeout}s: {' '.join(command[:4])}...")
+            stderr = e.stderr or b''
         except (FileNotFoundError, subprocess.CalledProcessError) as e:
             logging.error(f"Pandoc execution failed: {e}")
-            if hasattr(e, 'stderr'): logging.error(e.stderr.decode('utf-8'))
-            return False
+            stderr = getattr(e, 'stderr', None) or b''
+        messages = stderr.decode('utf-8', errors='replace')
+        if log_path:
+            log_path.write_text(f"$ {subprocess.list2cmdline(command)}\n\n{messages}", encoding='utf-8')
+        elif messages:
+            (logging.info if success else logging.error)(f"Pandoc Messages:\n{messages}")
+        return success
+
+def _run_process_group(command, stdin, input_bytes, timeout):
+    # Pandoc starts its own children (xelatex for PDF), so it runs in a new process group/session and the
+    # whole group is killed on timeout; killing only pandoc would leave xelatex running. Returns stderr.
+    if os.name == 'nt':
+        process = subprocess.Popen(command, stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE, creationflags=subprocess.CREATE_NEW_PROCESS_GROUP)
+    else:
+        process = subprocess.Popen(command, stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=True)
+    try:
+        stdout, stderr = process.communicate(input_bytes, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        _kill_process_group(process)
+        stdout, stderr = process.communicate()
+        raise subprocess.TimeoutExpired(command, timeout, stdout, stderr)
+    except BaseException:
+        _kill_process_group(process)
+        process.wait()
+        raise
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, command, stdout, stderr)
+    return stderr
+
+def _kill_process_group(process):
+    try:
+        if os.name == 'nt':
+            subprocess.run(["taskkill", "/F", "/T", "/PID", str(process.pid)], capture_output=True)
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        pass
+    process.kill()
 
 def read_export_config(note_path: Path) -> dict:
     config = {'mode': 'manual', 'depth': 1, 'formats': []}
@@ -250,7 +960,109 @@ def find_vault_for_note(vault_paths, note_path):
         if vp in resolved_note.parents: return vp
     return None
 
+def export_note(start_note_path: Path, config: dict, vault_path: Path, export_config: dict, vault_index: VaultIndex = None, note_cache: dict = None):
+    # profile_export: true writes a per-stage JSON report; "cprofile" also profiles the run. cProfile only sees the
+    # calling thread, so notes are flattened serially in that mode.
+    profile_mode = config.get("profile_export", False)
+    profiler = cProfile.Profile() if profile_mode == 'cprofile' else None
+    if profiler: profiler.enable()
+    start = time.perf_counter()
+    try:
+        exporter, conversions = _run_export(start_note_path, config, vault_path, export_config, vault_index, note_cache, 1 if profiler else None)
+    finally:
+        total_seconds = time.perf_counter() - start
+        if profiler: profiler.disable()
+    if profile_mode: exporter.write_profile_report(total_seconds, profiler)
+    return exporter, conversions
+
+def incremental_export_name(vault_path: Path, moc_path: Path) -> str:
+    # MOCs with the same file name in different folders (PA/Index.md, PB/Index.md) must not share a folder.
+    relative = moc_path.resolve().relative_to(vault_path.resolve()).as_posix()
+    return f"Export_{vault_path.name}_{moc_path.stem}_{hashlib.sha1(relative.encode('utf-8')).hexdigest()[:8]}"
+
+def _run_export(start_note_path, config, vault_path, export_config, vault_index, note_cache, flatten_workers):
+    exporter = ONEExporter(vault_path, Path(config["export_dir"]), config.get("exclude_folders", []),
+                           rebuild_index=config.get("rebuild_index", False),
+                           flatten_workers=flatten_workers or config.get("flatten_workers", DEFAULT_FLATTEN_WORKERS),
+                           asset_link_mode=config.get("asset_link_mode", 'auto'),
+                           incremental=config.get("incremental_export", False),
+                           export_name=incremental_export_name(vault_path, start_note_path),
+                           vault_index=vault_index, note_cache=note_cache,
+                           scan_workers=config.get("scan_workers", DEFAULT_SCAN_WORKERS))
+    exporter.build_package(start_note_path, export_config)
+    conversions = {}
+    output_formats = export_config.get('formats', [])
+    if output_formats and 'md' not in [f.lower() for f in output_formats]:
+        cache_bytes = cache_limit(config, 'conversions')  # 0 disables the conversion cache
+        cache = ConversionCache(CACHE_DIR / "conversions", cache_bytes) if cache_bytes else None
+        conversions = exporter.convert_package(output_formats, config.get("conversion_workers", DEFAULT_CONVERSION_WORKERS),
+                                               config.get("conversion_timeout", DEFAULT_CONVERSION_TIMEOUT), cache,
+                                               image_optimizer.load_profiles(config.get("image_optimization")), config.get("image_workers"),
+                                               config.get("pandoc_ast_cache", False),
+                                               {name: cache_limit(config, name) for name in ('ast', 'images')})
+    return exporter, conversions
+
+def expand_note_arguments(arguments):
+    notes = []
+    for argument in arguments:
+        matches = sorted(glob.glob(argument, recursive=True)) if glob.has_magic(argument) else [argument]
+        notes.extend(Path(m).resolve() for m in matches if m.lower().endswith('.md'))
+    return list(dict.fromkeys(notes))
+
+def run_export_job(start_note_path: Path, config: dict, vault_index: VaultIndex = None, note_cache: dict = None):
+    # Shared by batch and server mode: never raises, always returns a JSON-serialisable result.
+    result = {'note': str(start_note_path), 'status': 'failed', 'export_root': None, 'conversions': {}, 'errors': []}
+    vault_path = find_vault_for_note(config["vault_paths"], start_note_path)
+    if not start_note_path.is_file() or not vault_path:
+        result['errors'].append("Note not found." if not start_note_path.is_file() else "Note is not inside any configured vault.")
+        return result, None
+    try:
+        exporter, conversions = export_note(start_note_path, config, vault_path, read_export_config(start_note_path), vault_index, note_cache)
+    except Exception as e:
+        logging.exception(f"Export of '{start_note_path}' failed")
+        result['errors'].append(str(e))
+        return result, None
+    result['export_root'] = str(exporter.export_root)
+    result['conversions'] = conversions
+    result['errors'].extend(f"{note}: {error}" for note, error in exporter.flatten_errors)
+    if not result['errors'] and all(c['success'] for c in conversions.values()): result['status'] = 'ok'
+    return result, exporter
+
+def batch_main(argv):
+    parser = argparse.ArgumentParser(prog="ONE_Exporter.py --batch", description="Export several MOC notes without any GUI.")
+    parser.add_argument('notes', nargs='+', help="MOC note paths or glob patterns (e.g. 'Vault/MOCs/**/*.md')")
+    parser.add_argument('--rebuild-index', action='store_true', help="ignore the cached vault index and rebuild it")
+    parser.add_argument('--profile', action='store_true', help="write a per-stage timing report in each export folder")
+    parser.add_argument('--cprofile', action='store_true', help="like --profile, and also profile the run with cProfile")
+    args = parser.parse_args(argv)
+    # stdout carries only the JSON summary; progress logging goes to stderr.
+    logging.getLogger().handlers[0].setStream(sys.stderr)
+    try:
+        with open(CONFIG_FILE, 'r') as f: config = json.load(f)
+    except FileNotFoundError:
+        print(json.dumps({'status': 'error', 'error': f"'{CONFIG_FILE}' not found. Run config_tool.py first.", 'exports': []}))
+        return 2
+    if args.rebuild_index: config['rebuild_index'] = True
+    if args.profile or args.cprofile: config['profile_export'] = 'cprofile' if args.cprofile else True
+    notes = expand_note_arguments(args.notes)
+    if not notes:
+        print(json.dumps({'status': 'error', 'error': "No Markdown notes matched the given arguments.", 'exports': []}))
+        return 2
+    vault_indexes, note_caches, results = {}, {}, []
+    for start_note_path in notes:
+        vault_path = find_vault_for_note(config["vault_paths"], start_note_path)
+        result, exporter = run_export_job(start_note_path, config, vault_indexes.get(vault_path), note_caches.setdefault(vault_path, {}))
+        if exporter: vault_indexes[vault_path] = exporter.vault_index
+        results.append(result)
+    failed = sum(1 for r in results if r['status'] != 'ok')
+    print(json.dumps({'status': 'ok' if not failed else 'failed', 'total': len(results), 'failed': failed, 'exports': results}, indent=2))
+    return 1 if failed else 0
+
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--batch':
+        sys.exit(batch_main(sys.argv[2:]))
+    import tkinter as tk
+    from tkinter import filedialog, messagebox
     root = tk.Tk()
     root.withdraw()
     start_note_str = None
@@ -279,11 +1091,9 @@ def main():
     if not vault_path:
         messagebox.showerror("Error", f"La nota '{start_note_path.name}' no está en ningún vault configurado.")
         return
-    exporter = ONEExporter(vault_path, Path(config["export_dir"]), config.get("exclude_folders", []))
-    exporter.build_package(start_note_path, export_config)
+    exporter, conversions = export_note(start_note_path, config, vault_path, export_config)
     output_formats = export_config.get('formats', [])
     if output_formats and 'md' not in [f.lower() for f in output_formats]:
-        exporter.convert_package(output_formats)
         final_message = f"Proceso completado.\n\nPaquete de exportación en:\n{exporter.export_root}"
         if any(f in ['pdf', 'docx', 'epub'] for f in output_formats):
             final_message += f"\n\nDocumentos convertidos en:\n{exporter.export_root / OUTPUT_SUBFOLDER_NAME}"
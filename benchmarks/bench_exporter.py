@@ -0,0 +1,121 @@
+"""Stage-by-stage ONEExporter benchmark on synthetic vaults.
+
+Run with: python benchmarks/bench_exporter.py [--sizes 1000,10000,100000] [--output results.json]
+Each size gets a freshly generated, deterministic vault (see synthetic_vault.py). pandoc_ast.PANDOC_COMMAND
+is pointed at a stub script that copies its input to the output file, so convert_package runs end to
+end without a real pandoc/LaTeX install, on every platform. Results are printed (or written) as JSON for comparison
+across versions.
+"""
+import argparse, json, logging, platform, shutil, subprocess, sys, tempfile, time
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import ONE_Exporter as one
+import pandoc_ast
+from link_resolver import VaultIndex
+from synthetic_vault import generate_vault
+
+STUB_PANDOC = '''import shutil, sys
+args = sys.argv[1:]
+with open(args[args.index("-o") + 1], "wb") as out:
+    shutil.copyfileobj(sys.stdin.buffer, out)
+'''
+
+
+def install_stub_pandoc(directory: Path):
+    # Run through the interpreter rather than found on PATH: on Windows, CreateProcess only finds .exe files.
+    stub = directory / "pandoc_stub.py"
+    stub.write_text(STUB_PANDOC, encoding='utf-8')
+    pandoc_ast.PANDOC_COMMAND = [sys.executable, str(stub)]
+
+
+def timed(results, stage, func, *args):
+    start = time.perf_counter()
+    value = func(*args)
+    results[stage] = round(time.perf_counter() - start, 4)
+    return value
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=REPO_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_size(work_dir: Path, notes: int, args):
+    vault = generate_vault(work_dir / f"vault-{notes}", notes, args.links, args.embeds, args.depth, args.exclude, seed=args.seed)
+    export_dir = work_dir / f"exports-{notes}"
+    metadata = {'title': 'Benchmark', 'author': 'bench', 'date': '2024-01-01'}
+    stages, counts = {}, {}
+
+    auto = one.ONEExporter(vault['root'], export_dir, args.exclude, rebuild_index=True, flatten_workers=args.workers, vault_index=VaultIndex(vault['root']),
+                           scan_workers=args.scan_workers)
+    auto.vault_index = timed(stages, 'build_vault_index_cold', auto._build_vault_index)
+    counts['scan_directories_per_second'] = auto.scan_stats['directories_per_second']
+    auto.rebuild_index = False
+    timed(stages, 'build_vault_index_warm', auto._build_vault_index)
+    timed(stages, 'traverse_and_collect', auto._traverse_and_collect, vault['automatic_moc'], 0, -1)
+    timed(stages, 'flatten_notes', auto._flatten_notes, auto.notes_in_scope)
+    auto_config = {'mode': 'automatic', 'depth': 'infinite', 'metadata': metadata}
+    timed(stages, 'generate_moc_from_structure', auto._generate_moc_from_structure, vault['automatic_moc'], auto_config)
+    moc_path = auto.notes_dir / "_MOC_Guide.md"
+    full_markdown, _ = timed(stages, 'assemble_full_markdown', auto._assemble_full_markdown, moc_path)
+    conversions = timed(stages, 'convert_package', auto.convert_package, args.formats)
+    counts.update(index_entries=len(auto.vault_index), notes_in_scope=len(auto.notes_in_scope), assets=len(list(auto.assets_dir.iterdir())),
+                  assembled_bytes=len(full_markdown.encode('utf-8')), conversions_ok=sum(1 for c in conversions.values() if c['success']))
+
+    manual = one.ONEExporter(vault['root'], export_dir, args.exclude, flatten_workers=args.workers, vault_index=auto.vault_index)
+    manual_config = one.read_export_config(vault['manual_moc'])
+    moc = manual._parse_note(vault['manual_moc'])
+    manual.notes_in_scope.update(manual._linked_notes(vault['manual_moc']))
+    timed(stages, 'flatten_notes_manual', manual._flatten_notes, manual.notes_in_scope)
+    timed(stages, 'generate_moc_from_blueprint', manual._generate_moc_from_blueprint, moc['text'][moc['body_start']:], manual_config)
+    if counts['notes_in_scope']: stages['flatten_per_note_ms'] = round(stages['flatten_notes'] * 1000 / counts['notes_in_scope'], 4)
+    if not args.keep: shutil.rmtree(export_dir, ignore_errors=True)
+    return {'notes': notes, 'stages': stages, 'counts': counts}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default="1000,10000,100000", help="comma-separated note counts")
+    parser.add_argument('--links', type=int, default=5, help="wikilinks per note")
+    parser.add_argument('--embeds', type=int, default=1, help="image embeds per note")
+    parser.add_argument('--depth', type=int, default=2, help="folder nesting depth")
+    parser.add_argument('--exclude', nargs='*', default=['.obsidian', '.trash'])
+    parser.add_argument('--workers', type=int, default=one.DEFAULT_FLATTEN_WORKERS)
+    parser.add_argument('--scan-workers', type=int, default=one.DEFAULT_SCAN_WORKERS, help="threads listing vault directories")
+    parser.add_argument('--formats', default="pdf,docx,epub", help="formats passed to the stub pandoc")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--work-dir', type=Path, help="where vaults and exports are generated (default: a temp dir)")
+    parser.add_argument('--keep', action='store_true', help="keep generated vaults and exports")
+    parser.add_argument('--output', type=Path, help="write JSON results here instead of stdout")
+    args = parser.parse_args()
+    args.formats = [f for f in args.formats.split(',') if f]
+    logging.getLogger().setLevel(logging.WARNING)
+    work_dir = args.work_dir or Path(tempfile.mkdtemp(prefix="one-bench-"))
+    work_dir.mkdir(parents=True, exist_ok=True)
+    # Keep the benchmark's index and asset-hash caches out of the real cache/ folder.
+    one.CACHE_DIR = work_dir / "cache"
+    one.ASSET_HASH_CACHE_FILE = one.CACHE_DIR / "asset_hashes.json"
+    stub_dir = work_dir / "stub-bin"
+    stub_dir.mkdir(exist_ok=True)
+    install_stub_pandoc(stub_dir)
+    report = {'revision': git_revision(), 'python': platform.python_version(), 'platform': platform.platform(),
+              'parameters': {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items() if k not in ('output', 'work_dir', 'keep')},
+              'results': []}
+    try:
+        for size in [int(s) for s in args.sizes.split(',') if s]:
+            print(f"Benchmarking {size} notes...", file=sys.stderr)
+            report['results'].append(bench_size(work_dir, size, args))
+    finally:
+        if not args.keep and not args.work_dir: shutil.rmtree(work_dir, ignore_errors=True)
+    text = json.dumps(report, indent=2)
+    if args.output: args.output.write_text(text + "\n", encoding='utf-8')
+    else: print(text)
+
+
+if __name__ == "__main__":
+    main()
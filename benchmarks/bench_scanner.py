@@ -0,0 +1,78 @@
+"""Throughput check: markdown_scanner.render against the previous three-regex pipeline.
+
+Run with: python benchmarks/bench_scanner.py [--notes N] [--repeat R]
+The corpus avoids code spans and mid-word '#', where the two pipelines intentionally differ,
+so the outputs must match byte for byte; the script exits with status 1 if they do not.
+"""
+import argparse, random, re, sys, time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import markdown_scanner
+
+LEGACY_YAML_PATTERN = re.compile(r'^---\s*\n(.*?)\n---\s*\n', re.DOTALL)
+LEGACY_LINK_PATTERN = re.compile(r'(!?)\[\[([^|#\]]+)(?:\|([^\]]+))?\]\]')
+LEGACY_TAG_PATTERN = re.compile(r'(?<!#)#[\w-]+')
+WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore".split()
+
+
+def render_link(is_embed, target, alias):
+    return f"![{alias or target}]({target})" if is_embed else (alias or target)
+
+
+def legacy_render(text):
+    content = LEGACY_YAML_PATTERN.sub('', text, count=1)
+    content = LEGACY_TAG_PATTERN.sub('', content)
+    return LEGACY_LINK_PATTERN.sub(lambda m: render_link(bool(m.group(1)), m.group(2), m.group(3)), content)
+
+
+def scanner_render(text):
+    return markdown_scanner.render(text, render_link, markdown_scanner.body_start(text))
+
+
+def make_note(rng, paragraphs=12):
+    lines = ["---", f"title: Note {rng.randrange(10**6)}", "tags: [generated]", "---", ""]
+    for _ in range(paragraphs):
+        words = []
+        for _ in range(rng.randint(40, 120)):
+            roll = rng.random()
+            if roll < 0.04: words.append(f"[[Note {rng.randrange(1000)}]]")
+            elif roll < 0.05: words.append(f"[[Note {rng.randrange(1000)}|alias {rng.randrange(100)}]]")
+            elif roll < 0.055: words.append(f"![[image-{rng.randrange(200)}.png]]")
+            elif roll < 0.065: words.append(f"#tag-{rng.randrange(50)}")
+            else: words.append(rng.choice(WORDS))
+        lines.append(" ".join(words))
+        lines.append("")
+    return "\n".join(lines)
+
+
+def measure(func, corpus, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in corpus: func(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--notes', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    corpus = [make_note(rng) for _ in range(args.notes)]
+    megabytes = sum(len(text.encode('utf-8')) for text in corpus) / 1e6
+    mismatches = sum(1 for text in corpus if legacy_render(text) != scanner_render(text))
+    legacy_seconds = measure(legacy_render, corpus, args.repeat)
+    scanner_seconds = measure(scanner_render, corpus, args.repeat)
+    print(f"corpus: {args.notes} notes, {megabytes:.1f} MB")
+    print(f"legacy regex pipeline: {legacy_seconds:.3f}s ({megabytes / legacy_seconds:.1f} MB/s)")
+    print(f"single-pass scanner:   {scanner_seconds:.3f}s ({megabytes / scanner_seconds:.1f} MB/s)")
+    print(f"speedup: {legacy_seconds / scanner_seconds:.2f}x, mismatching notes: {mismatches}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+"""Deterministic synthetic Obsidian vault generator for benchmarks.
+
+Run with: python benchmarks/synthetic_vault.py OUTPUT_DIR [--notes N] [--links L] [--embeds E] [--depth D] [--seed S]
+The same arguments always produce byte-identical vaults.
+"""
+import argparse, json, random
+from pathlib import Path
+
+WORDS = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore "
+         "et dolore magna aliqua enim ad minim veniam quis nostrud exercitation ullamco laboris nisi").split()
+PNG_HEADER = b'\x89PNG\r\n\x1a\n'
+
+
+def note_name(i):
+    return f"Note {i:06d}"
+
+
+def note_folder(i, folder_depth, fanout=8):
+    parts = []
+    for level in range(folder_depth):
+        parts.append(f"area-{(i // fanout ** level) % fanout}")
+    return Path(*parts) if parts else Path()
+
+
+def generate_vault(root: Path, notes: int = 1000, links_per_note: int = 5, embeds_per_note: int = 1, folder_depth: int = 2,
+                   excluded_folders=('.obsidian', '.trash'), paragraphs: int = 4, seed: int = 42):
+    rng = random.Random(seed)
+    root.mkdir(parents=True, exist_ok=True)
+    image_count = max(1, notes // 10)
+    for i in range(image_count):
+        image_path = root / "attachments" / note_folder(i, max(0, folder_depth - 1)) / f"image-{i:05d}.png"
+        image_path.parent.mkdir(parents=True, exist_ok=True)
+        image_path.write_bytes(PNG_HEADER + rng.randbytes(2048))
+    for i in range(notes):
+        words_per_paragraph = [rng.randint(30, 90) for _ in range(paragraphs)]
+        tokens = [rng.choice(WORDS) for _ in range(sum(words_per_paragraph))]
+        for _ in range(links_per_note):
+            target = note_name(rng.randrange(notes))
+            tokens.insert(rng.randrange(len(tokens) + 1), f"[[{target}]]" if rng.random() < 0.7 else f"[[{target}|alias]]")
+        for _ in range(embeds_per_note):
+            tokens.insert(rng.randrange(len(tokens) + 1), f"![[image-{rng.randrange(image_count):05d}.png]]")
+        if rng.random() < 0.3: tokens.insert(rng.randrange(len(tokens) + 1), f"#tag-{rng.randrange(20)}")
+        body, position = [], 0
+        for count in words_per_paragraph:
+            body.append(" ".join(tokens[position:position + count]))
+            position += count
+        body[-1] += " " + " ".join(tokens[position:])
+        path = root / note_folder(i, folder_depth) / f"{note_name(i)}.md"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(f"---\ncreated: 2024-01-01\n---\n# {note_name(i)}\n\n" + "\n\n".join(body) + "\n", encoding='utf-8')
+    for folder in excluded_folders:
+        for i in range(max(1, notes // 100)):
+            path = root / folder / f"{note_name(i)}.md"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text("Excluded copy; must never be indexed.\n", encoding='utf-8')
+    chapter_count = min(notes, 50)
+    manual_moc = root / "MOC Manual.md"
+    lines = ["---", "export_mode: manual", "export_title: Synthetic Manual", "export_formats: [pdf, docx, epub]", "---", ""]
+    for i in range(chapter_count):
+        if i % 10 == 0: lines.append(f"## Part {i // 10 + 1}")
+        lines.append(f"{'    ' if i % 3 == 2 else ''}- [[{note_name(i)}]]")
+    manual_moc.write_text("\n".join(lines) + "\n", encoding='utf-8')
+    automatic_moc = root / "MOC Automatic.md"
+    automatic_moc.write_text("---\nexport_mode: automatic\nexport_depth: infinite\nexport_title: Synthetic Automatic\n---\n"
+                             + "\n".join(f"- [[{note_name(i)}]]" for i in range(min(notes, 5))) + "\n", encoding='utf-8')
+    return {'root': root, 'manual_moc': manual_moc, 'automatic_moc': automatic_moc, 'excluded_folders': list(excluded_folders)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('output', type=Path)
+    parser.add_argument('--notes', type=int, default=1000)
+    parser.add_argument('--links', type=int, default=5, help="wikilinks per note")
+    parser.add_argument('--embeds', type=int, default=1, help="image embeds per note")
+    parser.add_argument('--depth', type=int, default=2, help="folder nesting depth")
+    parser.add_argument('--exclude', nargs='*', default=['.obsidian', '.trash'], help="excluded folders to populate")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    vault = generate_vault(args.output, args.notes, args.links, args.embeds, args.depth, args.exclude, seed=args.seed)
+    print(json.dumps({key: str(value) if isinstance(value, Path) else value for key, value in vault.items()}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+import sys, os, json, time, shutil, hashlib, logging, threading, argparse
+from pathlib import Path
+
+# Local cache of Pandoc outputs. An entry is keyed by a hash of everything the conversion reads
+# (assembled Markdown, templates/, assets and the normalised pandoc command), so a hit can be copied
+# into _Converted/ instead of running pandoc/xelatex again. Entries are evicted least recently used
+# first once the cache grows beyond its size limit.
+# The note AST cache (cache/ast) and optimized image cache (cache/images) are plain folders of
+# content-addressed files; a hit touches the file, so prune_directory() can evict by mtime.
+BASE_DIR = Path(__file__).resolve().parent
+CACHE_ROOT = BASE_DIR / "cache"
+DEFAULT_CACHE_DIR = CACHE_ROOT / "conversions"
+DEFAULT_MAX_MB = 1024
+# cache name -> (config.json key, default size limit in MB)
+CACHE_LIMITS = {'conversions': ("conversion_cache_mb", DEFAULT_MAX_MB), 'ast': ("ast_cache_mb", 256), 'images': ("image_cache_mb", 1024)}
+INDEX_FILE_NAME = "index.json"
+INDEX_VERSION = 1
+
+
+def hash_file(path: Path, digest=None):
+    digest = digest or hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest
+
+
+def hash_directory(directory: Path) -> str:
+    digest = hashlib.sha256()
+    if directory.is_dir():
+        for path in sorted(p for p in directory.rglob('*') if p.is_file()):
+            digest.update(path.relative_to(directory).as_posix().encode('utf-8') + b'\0')
+            digest.update(hash_file(path).digest())
+    return digest.hexdigest()
+
+
+def touch(path: Path):
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def _directory_files(directory: Path):
+    if not directory.is_dir(): return []
+    files = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+    return files
+
+
+def prune_directory(directory: Path, max_bytes: int) -> int:
+    # Least recently used (oldest mtime) files go first until the folder fits in max_bytes.
+    files = sorted(_directory_files(directory))
+    total, removed = sum(size for _, size, _ in files), 0
+    for _, size, path in files:
+        if total <= max_bytes: break
+        try:
+            os.unlink(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed
+
+
+def directory_stats(directory: Path, max_bytes: int) -> dict:
+    files = _directory_files(directory)
+    return {'cache_dir': str(directory), 'entries': len(files), 'bytes': sum(size for _, size, _ in files), 'max_bytes': max_bytes}
+
+
+def cache_limit(config: dict, name: str) -> int:
+    key, default = CACHE_LIMITS[name]
+    return int(config.get(key, default) * 1024 * 1024)
+
+
+class ConversionCache:
+    def __init__(self, cache_dir: Path = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index_file = cache_dir / INDEX_FILE_NAME
+        self._lock = threading.Lock()
+        self.entries = self._load_index()
+
+    def _load_index(self):
+        try:
+            data = json.loads(self.index_file.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return {}
+        if data.get('version') != INDEX_VERSION: return {}
+        return {key: entry for key, entry in data.get('entries', {}).items() if (self.cache_dir / entry['file']).is_file()}
+
+    def _save_index(self):
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.index_file.with_suffix('.tmp')
+            tmp_path.write_text(json.dumps({'version': INDEX_VERSION, 'entries': self.entries}, indent=1), encoding='utf-8')
+            os.replace(tmp_path, self.index_file)
+        except OSError as e:
+            logging.warning(f"Could not save conversion cache index: {e}")
+
+    @staticmethod
+    def make_key(fmt: str, document_hash: str, templates_hash: str, assets: dict, command: list, versions: dict) -> str:
+        # versions: {program: '--version' line} of pandoc and the PDF engine, so an upgrade invalidates old outputs.
+        digest = hashlib.sha256()
+        payload = {'format': fmt, 'document': document_hash, 'templates': templates_hash, 'assets': sorted(assets.items()), 'command': command,
+                   'versions': sorted(versions.items())}
+        digest.update(json.dumps(payload, sort_keys=True).encode('utf-8'))
+        return digest.hexdigest()
+
+    def fetch(self, key: str, destination: Path) -> bool:
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None: return False
+            try:
+                shutil.copyfile(self.cache_dir / entry['file'], destination)
+            except OSError as e:
+                logging.warning(f"Conversion cache entry {key[:12]} unreadable, dropping it: {e}")
+                del self.entries[key]
+                self._save_index()
+                return False
+            entry['last_used'] = time.time()
+            entry['hits'] = entry.get('hits', 0) + 1
+            self._save_index()
+        return True
+
+    def store(self, key: str, source: Path, label: str = ""):
+        size = source.stat().st_size
+        if size > self.max_bytes: return
+        file_name = f"{key}{source.suffix}"
+        with self._lock:
+            try:
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                tmp_path = self.cache_dir / f".{file_name}.tmp"
+                shutil.copyfile(source, tmp_path)
+                os.replace(tmp_path, self.cache_dir / file_name)
+            except OSError as e:
+                logging.warning(f"Could not store {source.name} in the conversion cache: {e}")
+                return
+            now = time.time()
+            self.entries[key] = {'file': file_name, 'label': label, 'size': size, 'created': now, 'last_used': now, 'hits': 0}
+            self._evict(self.max_bytes)
+            self._save_index()
+
+    def _evict(self, max_bytes: int):
+        total = sum(entry['size'] for entry in self.entries.values())
+        removed = 0
+        for key, entry in sorted(self.entries.items(), key=lambda item: item[1]['last_used']):
+            if total <= max_bytes: break
+            (self.cache_dir / entry['file']).unlink(missing_ok=True)
+            del self.entries[key]
+            total -= entry['size']
+            removed += 1
+        return removed
+
+    def prune(self, max_bytes: int = None):
+        with self._lock:
+            removed = self._evict(self.max_bytes if max_bytes is None else max_bytes)
+            known = {entry['file'] for entry in self.entries.values()} | {INDEX_FILE_NAME}
+            if self.cache_dir.is_dir():
+                for path in self.cache_dir.iterdir():
+                    if path.is_file() and path.name not in known: path.unlink()
+            self._save_index()
+        return removed
+
+    def clear(self):
+        return self.prune(0)
+
+    def stats(self):
+        with self._lock:
+            return {'cache_dir': str(self.cache_dir), 'entries': len(self.entries), 'bytes': sum(e['size'] for e in self.entries.values()),
+                    'max_bytes': self.max_bytes, 'hits': sum(e.get('hits', 0) for e in self.entries.values())}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or clear the ONE caches (conversions, note ASTs, optimized images).")
+    parser.add_argument('command', nargs='?', choices=['stats', 'list', 'prune', 'clear'], default='stats')
+    parser.add_argument('--cache', choices=[*CACHE_LIMITS, 'all'], default='all', help="which cache to act on (default: all)")
+    parser.add_argument('--max-mb', type=float, help="size limit used by 'prune' (default: the cache's '*_cache_mb' key in config.json)")
+    parser.add_argument('--cache-root', type=Path, default=CACHE_ROOT)
+    args = parser.parse_args()
+    try:
+        with open(BASE_DIR / "config.json", 'r') as f: config = json.load(f)
+    except (OSError, ValueError):
+        config = {}
+    report = {}
+    for name in (CACHE_LIMITS if args.cache == 'all' else [args.cache]):
+        directory = args.cache_root / name
+        max_bytes = int(args.max_mb * 1024 * 1024) if args.max_mb is not None else cache_limit(config, name)
+        if name == 'conversions':
+            cache = ConversionCache(directory, max_bytes)
+            if args.command == 'list':
+                for key, entry in sorted(cache.entries.items(), key=lambda item: item[1]['last_used'], reverse=True):
+                    last_used = time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['last_used']))
+                    print(f"{name:11} {key[:12]}  {entry['size'] / 1024:10.1f} KiB  {entry.get('hits', 0):4d} hits  {last_used}  {entry['label']}")
+            elif args.command in ('prune', 'clear'):
+                print(f"{name}: removed {cache.clear() if args.command == 'clear' else cache.prune()} entries.")
+            report[name] = cache.stats()
+        else:
+            if args.command == 'list':
+                for mtime, size, path in sorted(_directory_files(directory), reverse=True):
+                    last_used = time.strftime('%Y-%m-%d %H:%M', time.localtime(mtime))
+                    print(f"{name:11} {Path(path).name[:24]}  {size / 1024:10.1f} KiB  {last_used}")
+            elif args.command in ('prune', 'clear'):
+                print(f"{name}: removed {prune_directory(directory, 0 if args.command == 'clear' else max_bytes)} entries.")
+            report[name] = directory_stats(directory, max_bytes)
+    if args.command != 'list': print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
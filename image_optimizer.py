@@ -0,0 +1,140 @@
+import os, shutil, hashlib, logging
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from conversion_cache import touch, prune_directory
+
+# Optional image optimization before conversion: JPEG/PNG assets wider than a format's limit are
+# downscaled and recompressed in a process pool (Pillow is CPU-bound), so xelatex and the EPUB writer
+# never see full-size phone screenshots. Variants are cached by source hash and settings, so each
+# image is only processed once across exports.
+OPTIMIZABLE_EXTENSIONS = {'.png', '.jpg', '.jpeg'}
+PRINT_WIDTH_INCHES = 6.5  # widest an image is ever printed; 'dpi' is turned into a pixel limit with it
+SOURCE_DPI = 96  # what pandoc assumes for images without DPI metadata
+VARIANT_VERSION = 1  # bump when the optimization itself changes, to invalidate cached variants
+DEFAULT_PROFILES = {
+    'pdf': {'max_width': 2400, 'dpi': 300, 'jpeg_quality': 85},
+    'docx': {'max_width': 2000, 'dpi': 220, 'jpeg_quality': 85},
+    'epub': {'max_width': 1600, 'dpi': None, 'jpeg_quality': 80},
+}
+
+
+def _pil_image():
+    # Pillow is imported on first use: it is slow to import and most exports never touch it.
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    return Image
+
+
+def available():
+    return _pil_image() is not None
+
+
+def load_profiles(setting) -> dict:
+    # config.json 'image_optimization': true for the defaults, or {format: {overrides} | false}.
+    if not setting: return {}
+    if setting is True: return {fmt: dict(profile) for fmt, profile in DEFAULT_PROFILES.items()}
+    profiles = {}
+    for fmt, overrides in setting.items():
+        if overrides is False: continue
+        profile = dict(DEFAULT_PROFILES.get(fmt.lower(), DEFAULT_PROFILES['pdf']))
+        if isinstance(overrides, dict): profile.update(overrides)
+        profiles[fmt.lower()] = profile
+    return profiles
+
+
+def max_pixels(profile: dict):
+    limits = [profile.get('max_width')]
+    if profile.get('dpi'): limits.append(int(profile['dpi'] * PRINT_WIDTH_INCHES))
+    limits = [int(limit) for limit in limits if limit]
+    return min(limits) if limits else None
+
+
+def optimize_image(source: str, destination: str, pixel_limit, jpeg_quality: int):
+    # Runs in a worker process. Images that would not get smaller are stored unchanged.
+    source_size = os.path.getsize(source)
+    tmp_path = f"{destination}.{os.getpid()}.tmp"
+    Image = _pil_image()
+    with Image.open(source) as image:
+        image_format = image.format
+        width, height = image.size
+        scale = min(1.0, pixel_limit / width) if pixel_limit else 1.0
+        # Keep the printed size: the smaller image gets a proportionally lower DPI.
+        dpi = (image.info.get('dpi') or (SOURCE_DPI, SOURCE_DPI))[0] or SOURCE_DPI
+        options = {'dpi': (dpi * scale, dpi * scale)}
+        if image_format == 'JPEG':
+            options.update(quality=jpeg_quality, optimize=True, progressive=True)
+            if image.info.get('exif'): options['exif'] = image.info['exif']
+        else:
+            options.update(optimize=True)
+        if scale < 1.0:
+            image = image.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.LANCZOS)
+        image.save(tmp_path, format=image_format, **options)
+    if scale == 1.0 and os.path.getsize(tmp_path) >= source_size:
+        shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, destination)
+    return os.path.getsize(destination)
+
+
+class ImageOptimizer:
+    def __init__(self, cache_dir: Path, workers: int = None, max_bytes: int = None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.workers = workers or os.cpu_count() or 1
+        self.stats = {'optimized': 0, 'cached': 0, 'failed': 0, 'bytes_before': 0, 'bytes_after': 0}
+
+    def variant_path(self, digest: str, suffix: str, profile: dict) -> Path:
+        settings = f"{VARIANT_VERSION}:{max_pixels(profile)}:{profile.get('jpeg_quality')}"
+        return self.cache_dir / f"{digest}-{hashlib.sha1(settings.encode('utf-8')).hexdigest()[:12]}{suffix.lower()}"
+
+    def optimize(self, assets_dir: Path, asset_hashes: dict, profiles: dict) -> dict:
+        # Returns {format: {asset name: cached variant path}} for every optimizable asset.
+        variants, pending = {}, {}
+        for fmt, profile in profiles.items():
+            variants[fmt] = {}
+            for name, digest in asset_hashes.items():
+                suffix = Path(name).suffix
+                if suffix.lower() not in OPTIMIZABLE_EXTENSIONS: continue
+                variant = self.variant_path(digest, suffix, profile)
+                variants[fmt][name] = variant
+                if variant.exists():
+                    touch(variant)
+                    self.stats['cached'] += 1
+                elif variant not in pending:
+                    pending[variant] = (assets_dir / name, profile)
+        if pending: self._run(pending)
+        return {fmt: {name: path for name, path in names.items() if path.exists()} for fmt, names in variants.items()}
+
+    def _run(self, pending: dict):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with ProcessPoolExecutor(max_workers=max(1, min(self.workers, len(pending)))) as pool:
+            futures = {pool.submit(optimize_image, str(source), str(variant), max_pixels(profile), int(profile.get('jpeg_quality') or 85)): (source, variant)
+                       for variant, (source, profile) in pending.items()}
+            for future in as_completed(futures):
+                source, variant = futures[future]
+                try:
+                    size = future.result()
+                except Exception as e:
+                    logging.warning(f"Could not optimize '{source.name}', using the original: {e}")
+                    self.stats['failed'] += 1
+                    continue
+                self.stats['optimized'] += 1
+                self.stats['bytes_before'] += source.stat().st_size
+                self.stats['bytes_after'] += size
+
+    def prune(self):
+        # Safe right after materialize(): the export keeps its own links to the variants it uses.
+        return prune_directory(self.cache_dir, self.max_bytes) if self.max_bytes is not None else 0
+
+    @staticmethod
+    def materialize(variants: dict, target_dir: Path):
+        # Rebuilt on every export so it never holds variants of assets that were removed.
+        if target_dir.exists(): shutil.rmtree(target_dir)
+        target_dir.mkdir(parents=True)
+        for name, variant in variants.items():
+            try:
+                os.link(variant, target_dir / name)
+            except OSError:
+                shutil.copyfile(variant, target_dir / name)
@@ -0,0 +1,151 @@
+import sys
+from functools import lru_cache
+from pathlib import Path
+from urllib.parse import unquote
+
+DEFAULT_MEMO_SIZE = 65536
+
+
+def _stem(name: str) -> str:
+    # Same result as Path(name).stem without building a Path.
+    dot = name.rfind('.')
+    return name[:dot] if 0 < dot < len(name) - 1 else name
+
+
+def _stem_path(rel_path: str) -> str:
+    slash = rel_path.rfind('/')
+    return rel_path[:slash + 1] + _stem(rel_path[slash + 1:])
+
+
+def _sort_key(rel_path: str):
+    # Duplicate basenames resolve to the file closest to the vault root, then alphabetically.
+    return rel_path.count('/'), rel_path.lower()
+
+
+def _stem_sort_key(rel_path: str):
+    # An extensionless [[link]] means a note: Report.md wins over Report.pdf or Report.canvas wherever they live.
+    return not rel_path.lower().endswith('.md'), rel_path.count('/'), rel_path.lower()
+
+
+def _freeze_table(candidates: dict, paths: list, sort_key) -> dict:
+    table = {}
+    for key, positions in candidates.items():
+        table[key] = positions[0] if len(positions) == 1 else tuple(sorted(set(positions), key=lambda p: sort_key(paths[p])))
+    return table
+
+
+def _lookup(table: dict, key: str) -> tuple:
+    value = table.get(key)
+    if value is None: return ()
+    return value if isinstance(value, tuple) else (value,)
+
+
+class VaultIndex:
+    """Compact vault index: interned relative paths in a flat table, file names and stems map to table positions."""
+
+    def __init__(self, vault_path: Path):
+        self.vault_path = vault_path
+        self.paths = []
+        # lowercase file name / stem -> position, or a tuple of positions (best first) when ambiguous
+        self._names = {}
+        self._stems = {}
+        self._name_candidates = {}  # key -> positions, while files are still being added
+        self._stem_candidates = {}
+        self._resolver = None
+
+    @classmethod
+    def from_dirs(cls, vault_path: Path, dirs_table: dict):
+        index = cls(vault_path)
+        for rel_dir, entry in dirs_table.items():
+            index.add_files(rel_dir, entry['files'])
+        return index.freeze()
+
+    def add_files(self, rel_dir: str, files: list):
+        # Directories can be added in any order (e.g. as a parallel scan lists them); freeze() sorts out ties.
+        names, stems = self._name_candidates, self._stem_candidates
+        prefix = f"{rel_dir}/" if rel_dir else ""
+        for file in files:
+            position = len(self.paths)
+            self.paths.append(sys.intern(prefix + file))
+            name = file.lower()
+            names.setdefault(name, []).append(position)
+            stems.setdefault(_stem(name), []).append(position)
+
+    def freeze(self):
+        self._names = _freeze_table(self._name_candidates, self.paths, _sort_key)
+        self._stems = _freeze_table(self._stem_candidates, self.paths, _stem_sort_key)
+        self._name_candidates, self._stem_candidates = {}, {}
+        return self
+
+    def __len__(self):
+        return len(self._names) + len(self._stems)
+
+    def file_count(self):
+        return len(self.paths)
+
+    def ambiguous_keys(self):
+        return sorted({key for table in (self._names, self._stems) for key, value in table.items() if isinstance(value, tuple)})
+
+    def path(self, position: int) -> Path:
+        return self.vault_path / self.paths[position]
+
+    def iter_paths(self):
+        vault_path = self.vault_path
+        return (vault_path / rel_path for rel_path in self.paths)
+
+    def name_candidates(self, key: str) -> tuple:
+        return _lookup(self._names, key)
+
+    def stem_candidates(self, key: str) -> tuple:
+        return _lookup(self._stems, key)
+
+    def candidates(self, key: str) -> tuple:
+        # An exact file name wins; otherwise the key is taken as a stem, notes first.
+        return self.name_candidates(key) or self.stem_candidates(key)
+
+    def get(self, key: str):
+        candidates = self.candidates(key)
+        return self.path(candidates[0]) if candidates else None
+
+    def resolver(self):
+        # One memoizing resolver per index, so exports sharing an index (batch/server mode) share the memo too.
+        if self._resolver is None: self._resolver = LinkResolver(self)
+        return self._resolver
+
+
+class LinkResolver:
+    """Resolves raw wikilink targets to vault files, memoizing the last DEFAULT_MEMO_SIZE distinct targets."""
+
+    def __init__(self, index: VaultIndex, memo_size: int = DEFAULT_MEMO_SIZE):
+        self.index = index
+        self.index_hits = 0
+        self.index_misses = 0
+        self.resolve = lru_cache(maxsize=memo_size)(self._resolve)
+
+    def memo_info(self):
+        return self.resolve.cache_info()
+
+    def _resolve(self, target: str):
+        clean = unquote(target).strip().lower()
+        if '/' in clean:
+            resolved = self._resolve_folder_qualified(clean.strip('/'))
+            if resolved is not None: return resolved
+            clean = clean.rsplit('/', 1)[-1]
+        candidates = self.index.candidates(clean) or self.index.stem_candidates(_stem(clean))
+        if not candidates:
+            self.index_misses += 1
+            return None
+        self.index_hits += 1
+        return self.index.path(candidates[0])
+
+    def _resolve_folder_qualified(self, clean: str):
+        # [[dir/note]] matches files whose vault-relative path, with or without extension, ends with dir/note.
+        name = clean.rsplit('/', 1)[-1]
+        paths = self.index.paths
+        for position in self.index.name_candidates(name) + self.index.stem_candidates(name) + self.index.stem_candidates(_stem(name)):
+            rel_path = paths[position].lower()
+            for candidate in (rel_path, _stem_path(rel_path)):
+                if candidate == clean or candidate.endswith('/' + clean):
+                    self.index_hits += 1
+                    return self.index.path(position)
+        return None
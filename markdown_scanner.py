@@ -0,0 +1,55 @@
+import re
+
+# Single-pass scanner for Obsidian notes: one regex alternation walks the text once and each
+# match is classified as fenced code, inline code, wikilink/embed or tag. Code spans are copied
+# verbatim, so tags and [[links]] shown inside code blocks are left untouched.
+FRONTMATTER_PATTERN = re.compile(r'^---\s*\n(.*?)\n---\s*\n', re.DOTALL)
+FENCE_PATTERN = r'^[ ]{0,3}(?P<fence>`{3,}|~{3,})[^\n]*(?s:.*?)(?:\n[ ]{0,3}(?P=fence)[`~]*[ \t]*(?=\n|\Z)|\Z)'
+INLINE_CODE_PATTERN = r'(?<!`)(?P<code>`+)(?!`)(?s:(?:(?!\n[ \t]*\n).)+?)(?<!`)(?P=code)(?!`)'
+WIKILINK_PATTERN = r'(?P<embed>!?)\[\[(?P<target>[^|#\]\n]+)(?:#[^|\]\n]*)?(?:\|(?P<alias>[^\]\n]+))?\]\]'
+TAG_PATTERN = r'(?<!\S)#[\w/-]+'
+# Every token starts with one of these characters (or an indented fence); checking that first lets the
+# regex engine skip plain text instead of trying all four alternatives at every position.
+TOKEN_START = r'(?=[`~\[!#]|^ )'
+TOKEN_PATTERN = re.compile(f'{TOKEN_START}(?:(?P<fenced>{FENCE_PATTERN})|(?P<inline>{INLINE_CODE_PATTERN})|(?P<link>{WIKILINK_PATTERN})|(?P<tag>{TAG_PATTERN}))', re.MULTILINE)
+FENCE_ONLY_PATTERN = re.compile(FENCE_PATTERN, re.MULTILINE)
+
+
+def body_start(text: str) -> int:
+    match = FRONTMATTER_PATTERN.match(text)
+    return match.end() if match else 0
+
+
+def frontmatter(text: str):
+    match = FRONTMATTER_PATTERN.match(text)
+    return match.group(1) if match else None
+
+
+def scan_links(text: str, start: int = 0) -> list:
+    links = []
+    for match in TOKEN_PATTERN.finditer(text, start):
+        if match.lastgroup == 'link':
+            links.append((bool(match.group('embed')), match.group('target'), match.group('alias')))
+    return links
+
+
+def render(text: str, link_renderer, start: int = 0) -> str:
+    # Removes tags and replaces every link/embed with link_renderer(is_embed, target, alias).
+    pieces, position = [], start
+    for match in TOKEN_PATTERN.finditer(text, start):
+        kind = match.lastgroup
+        if kind == 'fenced' or kind == 'inline': continue
+        pieces.append(text[position:match.start()])
+        if kind == 'link':
+            pieces.append(link_renderer(bool(match.group('embed')), match.group('target'), match.group('alias')))
+        position = match.end()
+    pieces.append(text[position:])
+    return "".join(pieces)
+
+
+def lines_outside_code(text: str, start: int = 0):
+    position = start
+    for match in FENCE_ONLY_PATTERN.finditer(text, start):
+        yield from text[position:match.start()].splitlines()
+        position = match.end()
+    yield from text[position:].splitlines()
@@ -0,0 +1,74 @@
+import sys, json, subprocess, argparse, http.client
+from pathlib import Path
+from urllib import request, error
+
+# Thin client for one_server.py, meant to be called from the Obsidian Shell Commands plugin.
+# It only imports the standard library so it starts instantly; if no server is running it falls
+# back to a regular (cold) ONE_Exporter.py run.
+BASE_DIR = Path(__file__).resolve().parent
+CONFIG_FILE = BASE_DIR / "config.json"
+DEFAULT_PORT = 8765  # keep in sync with one_server.DEFAULT_PORT
+
+
+def server_url(port):
+    if port is None:
+        try:
+            with open(CONFIG_FILE, 'r') as f: port = json.load(f).get("server_port", DEFAULT_PORT)
+        except (OSError, ValueError):
+            port = DEFAULT_PORT
+    return f"http://127.0.0.1:{port}"
+
+
+def call(url, payload=None, timeout=None):
+    data = json.dumps(payload).encode('utf-8') if payload is not None else None
+    req = request.Request(url, data=data, headers={'Content-Type': 'application/json'}, method='POST' if data is not None else 'GET')
+    with request.urlopen(req, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send an export request to a running ONE server.")
+    parser.add_argument('note', nargs='?', help="MOC note to export")
+    parser.add_argument('--port', type=int)
+    parser.add_argument('--status', action='store_true', help="show the server status")
+    parser.add_argument('--shutdown', action='store_true', help="stop the server")
+    parser.add_argument('--no-fallback', action='store_true', help="fail instead of running a standalone export when no server is running")
+    args = parser.parse_args()
+    url = server_url(args.port)
+    try:
+        if args.status or args.shutdown:
+            print(json.dumps(call(f"{url}/status") if args.status else call(f"{url}/shutdown", {}), indent=2))
+            return 0
+        if not args.note: parser.error("a note path is required")
+        result = call(f"{url}/export", {'note': str(Path(args.note).resolve())})
+    except error.HTTPError as e:
+        # The server is running and answered with an error: a cold export would only repeat the work.
+        try:
+            message = json.loads(e.read()).get('error', e.reason)
+        except (ValueError, AttributeError, OSError):
+            message = e.reason
+        print(f"❌ El servidor ONE respondió {e.code}: {message}")
+        return 1
+    except (http.client.HTTPException, ConnectionError) as e:
+        # Connected, but the server dropped the request (it may still be working on it).
+        print(f"❌ El servidor ONE en {url} cerró la conexión sin responder: {e}")
+        return 1
+    except error.URLError as e:
+        if args.status or args.shutdown or args.no_fallback or not args.note:
+            print(f"ONE server not reachable at {url}: {e.reason}")
+            return 2
+        print(f"ONE server not reachable at {url}; running a standalone export.")
+        return subprocess.call([sys.executable, str(BASE_DIR / "ONE_Exporter.py"), args.note])
+    if result.get('status') == 'ok':
+        print(f"✅ Exportado en {result.get('seconds', 0)}s: {result['export_root']}")
+        for fmt, conversion in result.get('conversions', {}).items(): print(f"   {fmt.upper()}: {conversion['seconds']}s")
+        return 0
+    print(f"❌ La exportación de '{args.note}' falló:")
+    for message in result.get('errors', []) or [json.dumps(result)]: print(f"   {message}")
+    for fmt, conversion in result.get('conversions', {}).items():
+        if not conversion['success']: print(f"   {fmt.upper()}: ver {conversion['log']}")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
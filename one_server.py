@@ -0,0 +1,196 @@
+import sys, json, time, logging, threading, argparse
+from pathlib import Path
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import ONE_Exporter as one
+
+# Resident export server: keeps each vault's index and parsed notes in memory and serves export
+# requests over localhost HTTP, so an Obsidian click only pays for the export itself.
+DEFAULT_PORT = 8765
+DEFAULT_POLL_INTERVAL = 2.0  # seconds between mtime polls of every watched vault
+FRESHNESS_WINDOW = 1.0  # an export re-polls its vault first unless it was polled this recently
+
+
+class VaultState:
+    def __init__(self, vault_path: Path, exclude_folders: list, scan_workers: int = one.DEFAULT_SCAN_WORKERS):
+        self.vault_path = vault_path
+        self.exclude_folders = list(exclude_folders)
+        self.scan_workers = scan_workers
+        self.dirs_table = {}
+        self.index = None
+        self.note_cache = {}
+        self.refreshed_at = 0.0
+        logging.info(f"Loading vault: {vault_path}...")
+        self.refresh()
+        logging.info(f"Vault ready with {len(self.index)} index entries.")
+
+    def refresh(self):
+        self.dirs_table, rescanned = one.scan_vault_dirs(self.vault_path, self.exclude_folders, self.dirs_table, self.scan_workers)
+        if rescanned:
+            self.index = one.build_index_from_dirs(self.vault_path, self.dirs_table)
+            indexed = set(self.index.iter_paths())
+            for note_path in [p for p in self.note_cache if p not in indexed]: del self.note_cache[note_path]
+        self.refreshed_at = time.monotonic()
+        return rescanned
+
+
+class ExportServer:
+    def __init__(self, poll_interval: float = DEFAULT_POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self.vaults = {}
+        self.exports_served = 0
+        self.started_at = time.time()
+        # Exports and polls share one lock: exports run one at a time and never see a half-refreshed vault.
+        self._lock = threading.Lock()
+        # status() only reads this snapshot, so it answers immediately even while a PDF is being built.
+        self._status_lock = threading.Lock()
+        self._vault_status = {}
+        self._current_export = None
+        self._stop = threading.Event()
+
+    def _load_config(self):
+        with open(one.CONFIG_FILE, 'r') as f: return json.load(f)
+
+    def _vault_state(self, vault_path: Path, config: dict):
+        exclude_folders = config.get("exclude_folders", [])
+        state = self.vaults.get(vault_path)
+        if state is None or state.exclude_folders != list(exclude_folders):
+            state = self.vaults[vault_path] = VaultState(vault_path, exclude_folders, config.get("scan_workers", one.DEFAULT_SCAN_WORKERS))
+        return state
+
+    def export(self, note_path: Path):
+        config = self._load_config()
+        vault_path = one.find_vault_for_note(config["vault_paths"], note_path)
+        with self._lock:
+            state = None
+            if vault_path:
+                state = self._vault_state(vault_path, config)
+                if time.monotonic() - state.refreshed_at > FRESHNESS_WINDOW: state.refresh()
+                self._publish(state)
+            with self._status_lock: self._current_export = str(note_path)
+            start = time.perf_counter()
+            try:
+                result, _ = one.run_export_job(note_path, config, state.index if state else None, state.note_cache if state else None)
+            finally:
+                with self._status_lock:
+                    self._current_export = None
+                    self.exports_served += 1
+            result['seconds'] = round(time.perf_counter() - start, 2)
+            if state: self._publish(state)
+        return result
+
+    def _publish(self, state: VaultState):
+        summary = {'index_entries': len(state.index), 'directories': len(state.dirs_table), 'cached_notes': len(state.note_cache)}
+        with self._status_lock: self._vault_status[str(state.vault_path)] = summary
+
+    def status(self):
+        with self._status_lock:
+            return {'status': 'ok', 'uptime_seconds': round(time.time() - self.started_at), 'exports_served': self.exports_served,
+                    'exporting': self._current_export, 'vaults': dict(self._vault_status)}
+
+    def preload(self):
+        config = self._load_config()
+        with self._lock:
+            for vault in config.get("vault_paths", []):
+                if Path(vault).is_dir(): self._publish(self._vault_state(Path(vault).resolve(), config))
+
+    def poll_forever(self):
+        while not self._stop.wait(self.poll_interval):
+            with self._lock:
+                for state in list(self.vaults.values()):
+                    try:
+                        rescanned = state.refresh()
+                    except Exception:
+                        logging.exception(f"Polling {state.vault_path} failed")
+                        continue
+                    if rescanned:
+                        logging.info(f"{state.vault_path}: {rescanned} changed directories re-indexed.")
+                        self._publish(state)
+
+    def stop(self):
+        self._stop.set()
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    server_version = "ONE-Server/1"
+
+    def _from_browser(self):
+        # Browsers add an Origin header to cross-site requests; one_client.py never sends one. Any web page could
+        # otherwise POST a "simple" (text/plain, no CORS preflight) request to trigger exports or a shutdown.
+        if self.headers.get('Origin') is None: return False
+        self._reply(403, {'status': 'error', 'error': "Requests from web pages are not accepted."})
+        return True
+
+    def do_GET(self):
+        if self._from_browser(): return
+        if self.path == '/status': self._reply(200, self.server.app.status())
+        else: self._reply(404, {'status': 'error', 'error': f"Unknown endpoint: {self.path}"})
+
+    def do_POST(self):
+        if self._from_browser(): return
+        if self.headers.get_content_type() != 'application/json':
+            return self._reply(415, {'status': 'error', 'error': "Content-Type must be application/json."})
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return self._reply(400, {'status': 'error', 'error': "Request body must be JSON."})
+        if not isinstance(payload, dict):
+            return self._reply(400, {'status': 'error', 'error': "Request body must be a JSON object."})
+        if self.path == '/export':
+            note = payload.get('note')
+            if not isinstance(note, str) or not note: return self._reply(400, {'status': 'error', 'error': "'note' must be a note path."})
+            try:
+                result = self.server.app.export(Path(note))
+            except Exception as e:
+                # e.g. a missing or broken config.json: the client still gets an answer instead of a dropped connection.
+                logging.exception(f"Export request for '{note}' failed")
+                return self._reply(500, {'status': 'error', 'error': f"{type(e).__name__}: {e}"})
+            self._reply(200, result)
+        elif self.path == '/shutdown':
+            self._reply(200, {'status': 'ok'})
+            self.server.app.stop()
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+        else:
+            self._reply(404, {'status': 'error', 'error': f"Unknown endpoint: {self.path}"})
+
+    def _reply(self, code, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} {format % args}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resident ONE export server (localhost HTTP).")
+    parser.add_argument('--port', type=int, help=f"port to listen on (default: 'server_port' in config.json or {DEFAULT_PORT})")
+    parser.add_argument('--poll-interval', type=float, default=DEFAULT_POLL_INTERVAL, help="seconds between vault change polls")
+    args = parser.parse_args()
+    try:
+        with open(one.CONFIG_FILE, 'r') as f: config = json.load(f)
+    except FileNotFoundError:
+        logging.error(f"'{one.CONFIG_FILE}' not found. Run config_tool.py first.")
+        return 2
+    app = ExportServer(args.poll_interval)
+    app.preload()
+    httpd = ThreadingHTTPServer(('127.0.0.1', args.port or config.get("server_port", DEFAULT_PORT)), RequestHandler)
+    httpd.app = app
+    threading.Thread(target=app.poll_forever, daemon=True).start()
+    logging.info(f"ONE server listening on http://127.0.0.1:{httpd.server_address[1]}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        app.stop()
+        httpd.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
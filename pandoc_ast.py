@@ -0,0 +1,129 @@
+import os, json, hashlib, subprocess, threading
+from pathlib import Path
+
+from conversion_cache import touch, prune_directory
+
+# Per-note pandoc AST cache. Each flattened note is parsed to pandoc's JSON AST once and stored under
+# a hash of its text, the reader and the pandoc version. The MOC guide is parsed with a placeholder
+# paragraph where each note is included, and the notes' blocks are spliced in there, so every output
+# format is written from one combined AST (`--from json`) without pandoc re-reading the Markdown.
+READER_FORMAT = "markdown+raw_tex"
+PANDOC_COMMAND = ["pandoc"]  # how pandoc is launched everywhere; the benchmark points it at a stub script
+PLACEHOLDER_PREFIX = "ONEINCLUDE"
+
+
+class AstError(Exception):
+    pass
+
+
+def program_version(command: list):
+    # First line of '<command> --version', or None when the program cannot be run.
+    try:
+        result = subprocess.run([*command, "--version"], check=True, capture_output=True, text=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.splitlines()[0].strip() if result.stdout else None
+
+
+def pandoc_version():
+    return program_version(PANDOC_COMMAND)
+
+
+def placeholder(position: int) -> str:
+    return f"\n\n{PLACEHOLDER_PREFIX}{position}\n\n"
+
+
+def placeholder_position(block):
+    # The skeleton's placeholders come back as a paragraph holding a single Str.
+    if block.get('t') != 'Para' or len(block['c']) != 1: return None
+    inline = block['c'][0]
+    if inline.get('t') != 'Str' or not inline['c'].startswith(PLACEHOLDER_PREFIX): return None
+    suffix = inline['c'][len(PLACEHOLDER_PREFIX):]
+    return int(suffix) if suffix.isdigit() else None
+
+
+def dedupe_header_ids(node, seen: dict):
+    # Notes are parsed separately, so two of them can produce the same heading identifier; give repeats
+    # the same "-1", "-2" suffixes pandoc would have used for a single document.
+    if isinstance(node, list):
+        for item in node: dedupe_header_ids(item, seen)
+    elif isinstance(node, dict):
+        if node.get('t') == 'Header':
+            attributes = node['c'][1]
+            identifier = attributes[0]
+            if identifier:
+                if identifier in seen:
+                    seen[identifier] += 1
+                    while f"{identifier}-{seen[identifier]}" in seen: seen[identifier] += 1
+                    attributes[0] = f"{identifier}-{seen[identifier]}"
+                    seen[attributes[0]] = 0
+                else:
+                    seen[identifier] = 0
+        if 'c' in node: dedupe_header_ids(node['c'], seen)
+
+
+class AstCache:
+    def __init__(self, cache_dir: Path, version: str, reader: str = READER_FORMAT, max_bytes: int = None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.version = version
+        self.reader = reader
+        self.stats = {'parsed': 0, 'cached': 0}
+        self._lock = threading.Lock()
+
+    def path_for(self, text: str) -> Path:
+        digest = hashlib.sha256(f"{self.version}\0{self.reader}\0".encode('utf-8') + text.encode('utf-8')).hexdigest()
+        return self.cache_dir / f"{digest}.json"
+
+    def parse(self, text: str) -> Path:
+        path = self.path_for(text)
+        if path.exists():
+            touch(path)
+            self._count('cached')
+            return path
+        try:
+            result = subprocess.run([*PANDOC_COMMAND, f"--from={self.reader}", "--to=json"], input=text.encode('utf-8'), check=True, capture_output=True)
+        except OSError as e:
+            raise AstError(str(e))
+        except subprocess.CalledProcessError as e:
+            raise AstError(e.stderr.decode('utf-8', errors='replace').strip())
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(result.stdout)
+        os.replace(tmp_path, path)
+        self._count('parsed')
+        return path
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def prune(self):
+        # Called once the combined document is written, so no AST still needed by this export is evicted.
+        return prune_directory(self.cache_dir, self.max_bytes) if self.max_bytes is not None else 0
+
+    @staticmethod
+    def load(path: Path) -> dict:
+        with open(path, 'r', encoding='utf-8') as f: return json.load(f)
+
+
+def write_document(destination: Path, skeleton: dict, part_paths: dict, names: dict):
+    # Streams the combined AST: only the skeleton and one note's AST are in memory at a time.
+    seen = {}
+    with open(destination, 'w', encoding='utf-8') as f:
+        f.write('{"pandoc-api-version":' + json.dumps(skeleton['pandoc-api-version']) + ',"meta":' + json.dumps(skeleton['meta']) + ',"blocks":[')
+        first = True
+        for block in skeleton['blocks']:
+            position = placeholder_position(block)
+            if position is None:
+                blocks = [block]
+            elif position in part_paths:
+                blocks = AstCache.load(part_paths[position])['blocks']
+            else:
+                blocks = [{'t': 'RawBlock', 'c': ['html', f"<!-- INCLUDE FAILED: {names.get(position, '?')} -->"]}]
+            dedupe_header_ids(blocks, seen)
+            for item in blocks:
+                if not first: f.write(',')
+                f.write(json.dumps(item, ensure_ascii=False))
+                first = False
+        f.write(']}')